@@ -0,0 +1,78 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+class GroupCommitWriter:
+    # Funnels concurrent single-row inserts through one background thread that
+    # commits them in batches. At the start of a lecture hundreds of students
+    # scan at once; on SQLite every commit takes the write lock and syncs the
+    # journal, so sharing one commit between many scans removes most of the
+    # lock contention.
+    #
+    # submit() blocks until the row's batch is committed and returns the
+    # statement's rowcount for that row (0 when ON CONFLICT DO NOTHING skipped it).
+
+    def __init__(self, engine, statement, max_batch=256, max_wait=0.005):
+        self.engine = engine
+        self.statement = statement
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.rows = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, row, timeout=30):
+        future = Future()
+        self._ensure_started()
+        self._queue.put((row, future))
+        return future.result(timeout=timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='attendance-group-commit', daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                with self.engine.begin() as connection:
+                    counts = [connection.execute(self.statement, row).rowcount for row, _ in batch]
+            except Exception:
+                # One bad row (say a scan for a course deleted a moment ago) must not
+                # fail the rest: the batch is rolled back and redone a row at a time
+                self._write_each(batch)
+                continue
+            self.batches += 1
+            self.rows += len(batch)
+            for (_, future), count in zip(batch, counts):
+                future.set_result(count)
+
+    def _write_each(self, batch):
+        for row, future in batch:
+            try:
+                with self.engine.begin() as connection:
+                    count = connection.execute(self.statement, row).rowcount
+            except Exception as error:
+                future.set_exception(error)
+                continue
+            self.batches += 1
+            self.rows += 1
+            future.set_result(count)
@@ -0,0 +1,104 @@
+"""Replays a class-start burst of self-attendance scans against a scratch database.
+
+Every student hits /attendance/selfattendance/<token> at the same moment, the
+way a lecture hall does when the QR code goes up. Run from the repository root:
+
+    python benchmarks/attendance_burst.py --students 400
+    python benchmarks/attendance_burst.py --students 400 --group-commit
+    python benchmarks/attendance_burst.py --students 400 --database-url postgresql://localhost/burst
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=400)
+    parser.add_argument('--group-commit', action='store_true', help='route scans through the group-commit writer')
+    parser.add_argument('--database', help='database file to use (defaults to a temporary file)')
+    parser.add_argument('--database-url', help='an empty database given by SQLAlchemy URL instead, e.g. PostgreSQL')
+    args = parser.parse_args()
+
+    database = args.database or os.path.join(tempfile.mkdtemp(), 'attendance_burst.sqlite3')
+    database_url = args.database_url or 'sqlite:///' + os.path.abspath(database)
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    from datetime import date
+    from app import create_app, db, create_admin, Users, Course, CourseEnrollment, Attendance, qr_gen
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_url,
+                      'ATTENDANCE_GROUP_COMMIT': args.group_commit})
+    app.app_context().push()
+    create_admin()
+    course = Course(name='Burst', description='', start_date=date.today(), end_date=date.today())
+    db.session.add(course)
+    db.session.commit()
+    db.session.execute(Users.__table__.insert(), [
+        {'username': f'burst{i}', 'email': f'burst{i}@example.com', 'password': 'x', 'roles': 'student'}
+        for i in range(args.students)])
+    student_ids = [user_id for (user_id,) in db.session.execute(
+        db.select(Users.id).where(Users.username.like('burst%')))]
+    db.session.execute(CourseEnrollment.__table__.insert(), [
+        {'user_id': user_id, 'course_id': course.id, 'user_qr': f'burst/{user_id}'} for user_id in student_ids])
+    db.session.commit()
+
+    secret = app.config['ATTENDANCE_TOKEN_SECRET']
+    clients = []
+    for user_id in student_ids:
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = user_id
+        clients.append((client, '/attendance/selfattendance/' + qr_gen.make_token(user_id, course.id, secret)))
+
+    start = threading.Barrier(len(clients) + 1)
+    latencies = []
+    errors = []
+
+    def scan(client, url):
+        start.wait()
+        began = time.perf_counter()
+        try:
+            response = client.get(url)
+            if response.status_code != 302:
+                errors.append(response.status_code)
+        except Exception as error:
+            errors.append(repr(error))
+        latencies.append(time.perf_counter() - began)
+
+    threads = [threading.Thread(target=scan, args=pair) for pair in clients]
+    for thread in threads:
+        thread.start()
+    began = time.perf_counter()
+    start.wait()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    marked = Attendance.query.filter_by(course_id=course.id).count()
+    print(f"database      : {db.engine.dialect.name}")
+    print(f"mode          : {'group commit' if args.group_commit else 'direct insert'}")
+    print(f"scans         : {len(clients)} ({marked} marked, {len(errors)} errors)")
+    print(f"wall time     : {elapsed:.3f}s ({len(clients) / elapsed:.0f} scans/s)")
+    print(f"latency p50   : {statistics.median(latencies) * 1000:.1f} ms")
+    print(f"latency p95   : {percentile(latencies, 0.95) * 1000:.1f} ms")
+    print(f"latency p99   : {percentile(latencies, 0.99) * 1000:.1f} ms")
+    print(f"latency max   : {max(latencies) * 1000:.1f} ms")
+    if errors:
+        print('first errors  :', errors[:5])
+    return 1 if errors or marked != len(clients) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,230 @@
+"""Drives the main routes concurrently against a database made by seed.py.
+
+Each worker plays one user after another: it logs in, opens the dashboard, the
+course catalog, one of the user's courses and one of its topics, then scans
+the attendance QR code (students) or opens the attendance report (teachers).
+Reports throughput and p50/p95/p99 latency per route and overall, and saves
+them as JSON so runs can be compared. Requests go through the app in this
+process by default, or over HTTP to a server started on the seeded directory
+with --url. Run from the repository root:
+
+    python benchmarks/seed.py /tmp/vcms-load
+    python benchmarks/load.py /tmp/vcms-load --concurrency 16 --duration 30 --output before.json
+    python benchmarks/load.py /tmp/vcms-load --concurrency 16 --duration 30 --compare before.json
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROUTES = ('login', 'dashboard', 'courses', 'view_course', 'view_topic', 'scan_attendance', 'attendance_stats')
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class TestClientSession:
+    # One user's browser, through Flask's test client in this process
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        response.close()
+        return response.status_code, response.headers.get('Location', '')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPSession:
+    # One user's browser, over HTTP with its own cookie jar
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+                                                  _NoRedirect())
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data else None
+        try:
+            with self.opener.open(urllib.request.Request(self.base_url + path, data=body, method=method)) as response:
+                response.read()
+                return response.status, response.headers.get('Location', '')
+        except urllib.error.HTTPError as error:
+            error.read()
+            return error.code, error.headers.get('Location', '')
+
+
+def load_people(database, manifest):
+    # Every seeded user with their courses, and a few topics of each course
+    connection = sqlite3.connect(database)
+    enrolled, taught, topics = {}, {}, {}
+    for user_id, course_id in connection.execute('SELECT user_id, course_id FROM course_enrollments'):
+        enrolled.setdefault(user_id, []).append(course_id)
+    for course_id, user_id in connection.execute('SELECT course_id, instructor_id FROM course_instructors'):
+        taught.setdefault(user_id, []).append(course_id)
+    for topic_id, course_id in connection.execute('SELECT id, course_id FROM topics'):
+        topics.setdefault(course_id, []).append(topic_id)
+    connection.close()
+    first, last = manifest['students']
+    students = [('student%d' % user_id, user_id, enrolled.get(user_id, [])) for user_id in range(first, last + 1)]
+    first, last = manifest['teachers']
+    teachers = [('teacher%d' % user_id, user_id, taught.get(user_id, [])) for user_id in range(first, last + 1)]
+    return students, [teacher for teacher in teachers if teacher[2]], topics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', help='directory made by benchmarks/seed.py')
+    parser.add_argument('--concurrency', type=int, default=8, help='users active at the same time')
+    parser.add_argument('--duration', type=float, default=20, help='seconds to run for')
+    parser.add_argument('--teacher-share', type=float, default=0.1, help='fraction of sessions played by teachers')
+    parser.add_argument('--url', help='base URL of a running server instead of the in-process app')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare against')
+    args = parser.parse_args()
+
+    directory = os.path.abspath(args.directory)
+    output = os.path.abspath(args.output) if args.output else None
+    compare = os.path.abspath(args.compare) if args.compare else None
+    with open(os.path.join(directory, 'seed.json')) as manifest_file:
+        manifest = json.load(manifest_file)
+    database = os.path.join(directory, 'seed.sqlite3')
+    students, teachers, topics = load_people(database, manifest)
+    password = manifest['password']
+
+    os.chdir(directory)
+    sys.path.insert(0, ROOT)
+    from app import create_app, qr_gen
+
+    # The app is created either way for the secret that signs attendance QR codes
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + database})
+    secret = app.config['ATTENDANCE_TOKEN_SECRET']
+    if args.url:
+        def new_session():
+            return HTTPSession(args.url)
+    else:
+        app.config['PROPAGATE_EXCEPTIONS'] = False
+
+        def new_session():
+            return TestClientSession(app)
+
+    samples = {route: [] for route in ROUTES}
+    errors = {route: 0 for route in ROUTES}
+    lock = threading.Lock()
+    deadline = None
+    start = threading.Barrier(args.concurrency + 1)
+
+    def timed(route, session, method, path, data=None, expect=(200,)):
+        began = time.perf_counter()
+        try:
+            status, location = session.request(method, path, data)
+            failed = status not in expect or '/login' in location
+        except Exception:
+            failed = True
+        elapsed = time.perf_counter() - began
+        with lock:
+            samples[route].append(elapsed)
+            if failed:
+                errors[route] += 1
+        return not failed
+
+    def play(rng):
+        teacher = teachers and rng.random() < args.teacher_share
+        username, user_id, courses = rng.choice(teachers if teacher else students)
+        session = new_session()
+        if not timed('login', session, 'POST', '/login', {'username': username, 'password': password}, expect=(302,)):
+            return
+        timed('dashboard', session, 'GET', '/dashboard')
+        timed('courses', session, 'GET', '/courses')
+        if not courses:
+            return
+        course_id = rng.choice(courses)
+        timed('view_course', session, 'GET', '/courses/%d' % course_id)
+        if topics.get(course_id):
+            timed('view_topic', session, 'GET', '/courses/%d/topics/%d' % (course_id, rng.choice(topics[course_id])))
+        if teacher:
+            timed('attendance_stats', session, 'GET', '/attendance/%d' % course_id)
+        else:
+            token = qr_gen.make_token(user_id, course_id, secret)
+            timed('scan_attendance', session, 'GET', '/attendance/selfattendance/' + token, expect=(302,))
+
+    def worker(number):
+        rng = random.Random(args.seed * 1000 + number)
+        start.wait()
+        while time.perf_counter() < deadline:
+            play(rng)
+
+    threads = [threading.Thread(target=worker, args=(number,), daemon=True) for number in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    deadline = time.perf_counter() + args.duration
+    began = time.perf_counter()
+    start.wait()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    every = [sample for route in ROUTES for sample in samples[route]]
+    results = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'commit': subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                 text=True).stdout.strip() or None,
+        'python': platform.python_version(),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'seed': manifest['arguments'],
+        'seconds': round(elapsed, 3),
+        'routes': {},
+    }
+    for route, values in [(route, samples[route]) for route in ROUTES] + [('all', every)]:
+        if not values:
+            continue
+        results['routes'][route] = {
+            'requests': len(values),
+            'errors': errors[route] if route != 'all' else sum(errors.values()),
+            'throughput': round(len(values) / elapsed, 1),
+            'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+            'max_ms': round(max(values) * 1000, 2),
+        }
+
+    previous = {}
+    if compare:
+        with open(compare) as compare_file:
+            previous = json.load(compare_file)['routes']
+    print(f"{'route':<18}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          + (f"{'p95 before':>12}{'change':>9}" if previous else ''))
+    for route, row in results['routes'].items():
+        line = (f"{route:<18}{row['requests']:>9}{row['errors']:>8}{row['throughput']:>9.1f}"
+                f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}")
+        if route in previous:
+            before = previous[route]['p95_ms']
+            line += f"{before:>12.1f}{(row['p95_ms'] - before) / before * 100 if before else 0:>+8.0f}%"
+        print(line)
+    if output:
+        with open(output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+        print('wrote ' + output)
+    return 1 if results['routes'].get('all', {}).get('errors') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
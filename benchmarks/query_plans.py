@@ -0,0 +1,118 @@
+"""Fails when a query issued by the routes makes SQLite scan a whole table.
+
+Builds a scratch database through the migrations, drives every route with the
+test client while recording the SQL it sends, then runs EXPLAIN QUERY PLAN on
+each distinct statement. A plan step "SCAN <table>" (no index) is reported for
+statements that filter or join; unfiltered reads such as the course catalog
+read the whole table by design. Run from the repository root:
+
+    python benchmarks/query_plans.py
+    python benchmarks/query_plans.py --verbose
+"""
+import argparse
+import io
+import os
+import re
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FULL_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+
+def drive_routes(app, db, models):
+    from datetime import date
+
+    Assignment, Attendance = models
+    admin, teacher, student = app.test_client(), app.test_client(), app.test_client()
+    admin.post('/login', data={'username': 'admin', 'password': 'admin'})
+    teacher.post('/register', data={'username': 'teacher', 'email': 't@example.com', 'password': 'p',
+                                    'confirm_password': 'p', 'role': 'teacher'})
+    student.post('/register', data={'username': 'student', 'email': 's@example.com', 'password': 'p',
+                                    'confirm_password': 'p', 'role': 'student'})
+    teacher.post('/courses/new', data={'course_title': 'Course', 'course_desc': '', 'start_date': '2024-01-01',
+                                       'end_date': '2099-01-01'})
+    teacher.post('/courses/1/topics/new', data={'title': 'Topic', 'description': ''})
+    db.session.add(Assignment(course_id=1, title='Homework', user_id=2, due_date=date(2099, 1, 1)))
+    db.session.add(Attendance(course_id=1, user_id=2, attendance_date=date.today(), status='present'))
+    db.session.commit()
+    student.get('/courses/1/enroll')
+    student.post('/courses/1/topics/1/messages/new', data={'msg_text': 'hello'})
+    teacher.post('/courses/1/topics/1/upload', data={'file': (io.BytesIO(b'notes'), 'notes.txt')},
+                 content_type='multipart/form-data')
+    chunked = teacher.post('/courses/1/topics/1/upload/chunked', json={'filename': 'video.mp4', 'size': 5}).json['url']
+    teacher.put(chunked + '?offset=0', data=b'video')
+    teacher.get(chunked)
+    teacher.post(chunked + '/complete')
+    student.get('/courses/1/topics/1/messages/stream?after=0', buffered=False).close()
+
+    for client in (admin, teacher, student):
+        for url in ['/', '/dashboard', '/courses', '/courses/1', '/courses/1/topics/1',
+                    '/courses/1/topics/1/messages?before=2', '/courses/1/assignment/1', '/qr/1',
+                    '/attendance/1?from=2024-01-01&to=2099-01-01', '/uploads/1',
+                    '/search?q=hello+co']:
+            client.get(url)
+    for url in ['/admin_panel', '/admin_panel/users?q=stu&role=student&admin=0&after=1',
+                '/admin_panel/students', '/admin_panel/teachers?admin=1', '/admin_panel/courses?q=Co',
+                '/admin_panel/user_edit?user_id=3', '/admin_panel/students/courses?user_id=3',
+                '/admin_panel/students/courses_inst?user_id=2', '/admin_panel/cache_stats']:
+        admin.get(url)
+    admin.post('/admin_panel/users_import', data={'file': (io.BytesIO(b'username,email,password,role\n'
+                                                                      b'imported,i@example.com,p,student\n'), 'u.csv')},
+               content_type='multipart/form-data')
+    teacher.post('/courses/1/enroll/bulk', data={'file': (io.BytesIO(b'imported\n'), 'r.csv')},
+                 content_type='multipart/form-data')
+    student.get('/courses/1/unenroll')
+    for url in ['/admin_panel/delete?message_id=1', '/admin_panel/delete?assignment_id=1',
+                '/admin_panel/delete?upload_id=1', '/admin_panel/delete?topic_id=1',
+                '/admin_panel/delete?course_id=1', '/admin_panel/delete?user_id=3']:
+        admin.get(url)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--verbose', action='store_true', help='print the plan of every statement')
+    args = parser.parse_args()
+
+    # Uploads and QR codes are written under ./static, so run inside a scratch directory
+    workdir = tempfile.mkdtemp()
+    for folder in ('uploads', 'qr_codes'):
+        os.makedirs(os.path.join(workdir, 'static', folder))
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    from sqlalchemy import event
+    from app import create_app, db, create_admin, Assignment, Attendance
+
+    # TESTING lets a failing route raise instead of hiding its queries behind a 500
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'query_plans.sqlite3'),
+                      'TESTING': True})
+    app.app_context().push()
+    create_admin()
+    statements = {}
+
+    @event.listens_for(db.engine, 'before_cursor_execute')
+    def record(connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+            statements.setdefault(statement, parameters)
+
+    drive_routes(app, db, (Assignment, Attendance))
+    event.remove(db.engine, 'before_cursor_execute', record)
+
+    failures = 0
+    with db.engine.connect() as connection:
+        for statement, parameters in statements.items():
+            plan = [row[3] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+            filtered = re.search(r'\b(WHERE|JOIN)\b', statement, re.IGNORECASE)
+            scans = [step for step in plan if FULL_SCAN.match(step)] if filtered else []
+            if scans:
+                failures += 1
+            if scans or args.verbose:
+                print(('FULL SCAN ' if scans else 'ok        ') + ' '.join(statement.split()))
+                for step in plan:
+                    print('    ' + step)
+    print(f'{len(statements)} statements checked, {failures} with full-table scans')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""Fills a fresh database with a synthetic semester of classroom data.
+
+Creates students, teachers, courses, enrollments, topics, messages, uploads and
+a daily attendance history from the start of the semester to today, using
+Core executemany in batches so millions of rows take minutes rather than hours.
+The database (seed.sqlite3) and the uploaded files go into DIRECTORY, together
+with seed.json describing what was created; benchmarks/load.py reads both.
+Everything is drawn from a seeded random generator, so the same arguments give
+the same data. Run from the repository root:
+
+    python benchmarks/seed.py /tmp/vcms-load
+    python benchmarks/seed.py /tmp/vcms-large --students 20000 --courses 500 --messages-per-topic 200
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from sqlalchemy import text
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = 'password'
+WORDS = ('lecture notes exam question answer homework deadline chapter slides lab project group reading '
+         'equation proof example theorem graph function matrix vector energy cell protein market essay '
+         'draft review feedback quiz syllabus tutorial recording office hours grade rubric').split()
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def class_days(start, end):
+    # Weekdays from start to end inclusive
+    day = start
+    while day <= end:
+        if day.weekday() < 5:
+            yield day
+        day += timedelta(days=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', help='new directory for the database and uploaded files')
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--teachers', type=int, default=50)
+    parser.add_argument('--courses', type=int, default=100)
+    parser.add_argument('--courses-per-student', type=int, default=5)
+    parser.add_argument('--topics-per-course', type=int, default=12)
+    parser.add_argument('--messages-per-topic', type=int, default=40)
+    parser.add_argument('--uploads-per-topic', type=int, default=2)
+    parser.add_argument('--distinct-files', type=int, default=50, help='uploads share this many stored files')
+    parser.add_argument('--semester-days', type=int, default=105, help='attendance history length in days')
+    parser.add_argument('--attendance-rate', type=float, default=0.85)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    directory = os.path.abspath(args.directory)
+    database = os.path.join(directory, 'seed.sqlite3')
+    if os.path.exists(database):
+        parser.error(database + ' already exists; seed into a new directory')
+    for folder in ('uploads', 'qr_codes'):
+        os.makedirs(os.path.join(directory, 'static', folder), exist_ok=True)
+    # Upload paths are relative to the working directory, like in the app
+    os.chdir(directory)
+    sys.path.insert(0, ROOT)
+    from app import (create_app, db, create_admin, chunked, recount_activity, stored_file_link, qr_gen, Users, Course,
+                     CourseEnrollment, CourseInstructor, Topic, Message, Upload, StoredFile, Attendance)
+
+    create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + database}).app_context().push()
+
+    rng = random.Random(args.seed)
+    create_admin()
+    today = date.today()
+    semester_start = today - timedelta(days=args.semester_days)
+    counts = {}
+    began = time.perf_counter()
+
+    def insert(model, rows):
+        # Core executemany in batches, each batch in its own transaction
+        table = model.__table__
+        total = 0
+        for batch in chunked(rows, args.batch_size):
+            with db.engine.begin() as connection:
+                connection.execute(table.insert(), batch)
+            total += len(batch)
+        counts[table.name] = counts.get(table.name, 0) + total
+        print(f'{table.name:<20} {counts[table.name]:>10,} rows  {time.perf_counter() - began:8.1f}s', flush=True)
+
+    # Users: the admin from create_admin() is id 1, then students, then teachers
+    first_student = 2
+    students = range(first_student, first_student + args.students)
+    teachers = range(students.stop, students.stop + args.teachers)
+    insert(Users, ({'id': user_id, 'username': 'student%d' % user_id, 'email': 'student%d@example.com' % user_id,
+                    'password': PASSWORD, 'roles': 'student', 'is_admin': False} for user_id in students))
+    insert(Users, ({'id': user_id, 'username': 'teacher%d' % user_id, 'email': 'teacher%d@example.com' % user_id,
+                    'password': PASSWORD, 'roles': 'teacher', 'is_admin': False} for user_id in teachers))
+
+    course_ids = range(1, args.courses + 1)
+    insert(Course, ({'id': course_id, 'name': '%s %d' % (sentence(rng, 2), course_id),
+                     'description': sentence(rng, 12), 'start_date': semester_start,
+                     'end_date': today + timedelta(days=30)} for course_id in course_ids))
+    instructor = {course_id: teachers[course_id % len(teachers)] for course_id in course_ids}
+    insert(CourseInstructor, ({'course_id': course_id, 'instructor_id': teacher}
+                              for course_id, teacher in instructor.items()))
+
+    # Teachers are enrolled in their own courses, as new_course() does
+    members = {course_id: [] for course_id in course_ids}
+    enrollments = [(instructor[course_id], course_id) for course_id in course_ids]
+    per_student = min(args.courses_per_student, len(course_ids))
+    for student in students:
+        for course_id in rng.sample(course_ids, per_student):
+            enrollments.append((student, course_id))
+            members[course_id].append(student)
+    insert(CourseEnrollment, ({'user_id': user_id, 'course_id': course_id,
+                               'user_qr': qr_gen.qr_location(course_id, user_id)} for user_id, course_id in enrollments))
+
+    # topics[n - 1] is the course of topic n
+    topics = [course_id for course_id in course_ids for _ in range(args.topics_per_course)]
+    insert(Topic, ({'id': topic_id, 'course_id': course_id, 'name': sentence(rng, 3)[:50],
+                    'description': sentence(rng, 20)} for topic_id, course_id in enumerate(topics, 1)))
+
+    semester_seconds = max(int((datetime.now() - datetime.combine(semester_start, datetime.min.time())).total_seconds()), 1)
+
+    def messages():
+        for topic_id, course_id in enumerate(topics, 1):
+            authors = members[course_id] or [instructor[course_id]]
+            offsets = sorted(rng.randrange(semester_seconds) for _ in range(args.messages_per_topic))
+            for offset in offsets:
+                yield {'topic_id': topic_id, 'created_by': rng.choice(authors), 'text': sentence(rng, rng.randint(4, 30)),
+                       'created_at': datetime.combine(semester_start, datetime.min.time()) + timedelta(seconds=offset)}
+    insert(Message, messages())
+
+    # A pool of small files shared by many uploads, stored by content like save_upload() does
+    files = []
+    for number in range(args.distinct_files):
+        filename = 'handout%d.%s' % (number, rng.choice(('pdf', 'txt', 'docx')))
+        content = ('%s\n' % sentence(rng, 200)).encode() * rng.randint(1, 20)
+        digest = hashlib.sha256(content).hexdigest()
+        link = stored_file_link(digest, filename)
+        os.makedirs(os.path.dirname('static/' + link), exist_ok=True)
+        with open('static/' + link, 'wb') as stored:
+            stored.write(content)
+        files.append({'path': link, 'sha256': digest, 'size': len(content), 'refcount': 0, 'filename': filename})
+    uploads = []
+    for topic_id in range(1, len(topics) + 1):
+        for _ in range(args.uploads_per_topic):
+            stored = rng.choice(files)
+            stored['refcount'] += 1
+            uploads.append({'topic_id': topic_id, 'link_to_file': stored['path'], 'sha256': stored['sha256'],
+                            'filename': stored['filename']})
+    insert(StoredFile, ({key: stored[key] for key in ('path', 'sha256', 'size', 'refcount')}
+                        for stored in files if stored['refcount']))
+    insert(Upload, uploads)
+
+    # Scans from every class day before today; scan_attendance() only records
+    # presence, so an absence is a missing row
+    days = list(class_days(semester_start, today - timedelta(days=1)))
+    insert(Attendance, ({'user_id': student, 'course_id': course_id, 'attendance_date': day, 'status': 'present'}
+                        for course_id in course_ids for day in days for student in members[course_id]
+                        if rng.random() < args.attendance_rate))
+
+    # Dashboard counters, as if every row had gone through the routes
+    for batch in chunked(course_ids, 500):
+        recount_activity(batch)
+        db.session.execute(text('UPDATE course_activity SET topics_added = topics, messages_added = messages, '
+                                   'uploads_added = uploads WHERE course_id IN (%s)' % ','.join(map(str, batch))))
+        db.session.commit()
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql('ANALYZE')
+
+    manifest = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'arguments': {key: value for key, value in vars(args).items() if key != 'directory'},
+        'password': PASSWORD,
+        'students': [students.start, students.stop - 1],
+        'teachers': [teachers.start, teachers.stop - 1],
+        'courses': [course_ids.start, course_ids.stop - 1],
+        'rows': counts,
+        'seconds': round(time.perf_counter() - began, 1),
+    }
+    with open(os.path.join(directory, 'seed.json'), 'w') as output:
+        json.dump(manifest, output, indent=2)
+    print(f'{sum(counts.values()):,} rows in {manifest["seconds"]}s; wrote {os.path.join(directory, "seed.json")}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""Measures cold-start time: importing the app, building it and answering a first request.
+
+Each run is a fresh Python process, as on a serverless cold start. It times
+`import app`, then create_app(), then one GET through the test client, and the
+whole process from launch to exit. Reports the median and minimum of each
+phase. --ref also measures an earlier commit of the repository (exported to a
+temporary directory with git archive) for comparison, and --imports lists the
+modules that take longest to import. Run from the repository root:
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 20 --ref HEAD~1 --imports 15
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PHASES = ('import', 'create', 'first_response', 'process')
+
+# Runs in the child process with the tree under test as its working directory.
+# Trees from before the application factory build their app while being imported.
+CHILD = r'''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, '.')
+import app as module
+imported = time.perf_counter()
+application = module.create_app() if hasattr(module, 'create_app') else module.app
+created = time.perf_counter()
+response = application.test_client().get(sys.argv[1])
+answered = time.perf_counter()
+print(json.dumps({'import': imported - started, 'create': created - imported, 'first_response': answered - created,
+                  'status': response.status_code}))
+'''
+
+
+def run_once(tree, path, database):
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + database)
+    began = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', CHILD, path], cwd=tree, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - began
+    if result.returncode != 0:
+        sys.exit(result.stderr)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['process'] = elapsed
+    return timings
+
+
+def slowest_imports(tree, count, database):
+    # Top-level imports of the child ranked by cumulative time, from python -X importtime
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + database)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD, '/login'], cwd=tree, env=env,
+                            capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        found = re.match(r'import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)', line)
+        if found and len(found.group(2)) <= 1:
+            rows.append((int(found.group(1)) / 1000, found.group(3)))
+    return sorted(rows, reverse=True)[:count]
+
+
+def export_tree(ref, directory):
+    archive = os.path.join(directory, 'tree.tar')
+    subprocess.run(['git', 'archive', '--format=tar', '-o', archive, ref], cwd=ROOT, check=True)
+    tree = os.path.join(directory, 'tree')
+    with tarfile.open(archive) as tar:
+        tar.extractall(tree)
+    return tree
+
+
+def measure(label, tree, args, database):
+    samples = {phase: [] for phase in PHASES}
+    statuses = set()
+    for _ in range(args.runs):
+        timings = run_once(tree, args.path, database)
+        statuses.add(timings['status'])
+        for phase in PHASES:
+            samples[phase].append(timings[phase])
+    result = {phase: {'median_ms': round(statistics.median(values) * 1000, 1),
+                      'min_ms': round(min(values) * 1000, 1)} for phase, values in samples.items()}
+    result['statuses'] = sorted(statuses)
+    print(f'{label}  ({args.runs} runs, GET {args.path} -> {", ".join(map(str, sorted(statuses)))})')
+    for phase in PHASES:
+        print(f"  {phase:<16}{result[phase]['median_ms']:>9.1f} ms median{result[phase]['min_ms']:>9.1f} ms min")
+    if args.imports:
+        print('  slowest imports (cumulative ms):')
+        for milliseconds, module in slowest_imports(tree, args.imports, database):
+            print(f'  {milliseconds:>10.1f}  {module}')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='fresh processes per tree')
+    parser.add_argument('--path', default='/login', help='URL of the first request')
+    parser.add_argument('--ref', help='also measure this git revision, e.g. HEAD~1')
+    parser.add_argument('--imports', type=int, default=0, metavar='N', help='list the N slowest top-level imports')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        # The first request should not need the database; an empty file stands in for it
+        database = os.path.join(scratch, 'startup.sqlite3')
+        if args.ref:
+            results[args.ref] = measure(args.ref, export_tree(args.ref, scratch), args, database)
+            print()
+        results['working tree'] = measure('working tree', ROOT, args, database)
+    if args.ref:
+        before, after = results[args.ref]['process']['median_ms'], results['working tree']['process']['median_ms']
+        print(f'\nprocess time {before:.1f} -> {after:.1f} ms ({(after - before) / before * 100:+.0f}%)')
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+        print('wrote ' + args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
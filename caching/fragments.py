@@ -0,0 +1,95 @@
+import threading
+from collections import OrderedDict
+
+class MemoryBackend:
+    # In-process store: fragments in an LRU bounded by total size, versions in a
+    # plain dict so they are never evicted. Only valid within one worker process.
+
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._fragments = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get_versions(self, scopes):
+        with self._lock:
+            return [self._versions.get(scope, 0) for scope in scopes]
+
+    def bump(self, scope):
+        with self._lock:
+            self._versions[scope] = self._versions.get(scope, 0) + 1
+
+    def get(self, key):
+        with self._lock:
+            value = self._fragments.get(key)
+            if value is not None:
+                self._fragments.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._fragments.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._fragments[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self._fragments.popitem(last=False)
+                self.size -= len(evicted)
+
+class RedisBackend:
+    # Store shared by every worker process, e.g. a Redis on the same host.
+    # Old fragments are never read again once a version moves on, so they are
+    # written with an expiry and left for Redis to drop.
+
+    def __init__(self, url, ttl=24 * 3600, prefix='vcms:'):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get_versions(self, scopes):
+        values = self.client.mget([self.prefix + 'version:' + scope for scope in scopes])
+        return [int(value) if value else 0 for value in values]
+
+    def bump(self, scope):
+        self.client.incr(self.prefix + 'version:' + scope)
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, value, ex=self.ttl)
+
+class FragmentCache:
+    # Caches rendered template fragments under a key plus the current version of
+    # every scope they depend on (e.g. 'catalog' or 'course:3'). Writers call
+    # bump() for the scopes they change, which makes every fragment built from
+    # the old versions unreachable instead of having to find and delete them.
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key, scopes, render):
+        # render() returns the fragment as a str, or None for "do not cache"
+        versions = self.backend.get_versions(scopes)
+        versioned_key = key + '@' + '.'.join(str(version) for version in versions)
+        value = self.backend.get(versioned_key)
+        if value is not None:
+            self.hits += 1
+            return value.decode()
+        self.misses += 1
+        value = render()
+        if value is not None:
+            self.backend.set(versioned_key, value.encode())
+        return value
+
+    def bump(self, *scopes):
+        for scope in scopes:
+            self.backend.bump(scope)
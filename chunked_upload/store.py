@@ -0,0 +1,135 @@
+import hashlib
+import os
+import shutil
+import threading
+
+BLOCK_SIZE = 64 * 1024
+
+def file_sha256(path):
+    # (hex SHA-256, size) of a file, read in BLOCK_SIZE blocks
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(BLOCK_SIZE), b''):
+            digest.update(block)
+            size += len(block)
+    return digest.hexdigest(), size
+
+class OffsetMismatch(Exception):
+    # The client sent a chunk for an offset other than the one the server has
+    # acknowledged, e.g. after a dropped connection; `offset` is the real one.
+    def __init__(self, offset):
+        super().__init__(offset)
+        self.offset = offset
+
+class ChunkedUploadStore:
+    # Files being uploaded in chunks are appended to <directory>/<upload id>.
+    # The acknowledged offset is the size of that file, so an upload can resume
+    # after a dropped connection or a server restart. Chunks are read from the
+    # request BLOCK_SIZE bytes at a time, never as a whole.
+    #
+    # The SHA-256 of the data is updated as each block is written. The hash
+    # objects are kept in memory between chunks; a process that does not have
+    # one (after a restart, or another worker) rebuilds it from the part file.
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._hashes = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def path(self, upload_id):
+        return os.path.join(self.directory, upload_id)
+
+    def begin(self, upload_id):
+        # The directory is made by the first upload, not at startup, so the app
+        # still starts where the instance folder is read-only
+        os.makedirs(self.directory, exist_ok=True)
+        open(self.path(upload_id), 'wb').close()
+        self._hashes[upload_id] = (0, hashlib.sha256())
+
+    def offset(self, upload_id):
+        try:
+            return os.path.getsize(self.path(upload_id))
+        except FileNotFoundError:
+            return None
+
+    def append(self, upload_id, offset, stream, limit):
+        # Appends `stream` at `offset` and returns the new offset. Raises
+        # OffsetMismatch when `offset` is not the current end of the file and
+        # ValueError when the data would go past `limit` bytes.
+        with self._upload_lock(upload_id):
+            current = self.offset(upload_id)
+            if current is None:
+                raise FileNotFoundError(upload_id)
+            if offset != current:
+                raise OffsetMismatch(current)
+            digest = self._hash(upload_id, current)
+            written = current
+            try:
+                with open(self.path(upload_id), 'ab') as part:
+                    while True:
+                        block = stream.read(BLOCK_SIZE)
+                        if not block:
+                            break
+                        if written + len(block) > limit:
+                            raise ValueError('upload is larger than its declared size')
+                        part.write(block)
+                        digest.update(block)
+                        written += len(block)
+                    part.flush()
+                    os.fsync(part.fileno())
+            except BaseException:
+                # Drop whatever part of the chunk arrived so the offset stays on
+                # a chunk boundary the client knows about
+                with open(self.path(upload_id), 'ab') as part:
+                    part.truncate(current)
+                self._hashes.pop(upload_id, None)
+                raise
+            self._hashes[upload_id] = (written, digest)
+            return written
+
+    def sha256(self, upload_id):
+        with self._upload_lock(upload_id):
+            return self._hash(upload_id, self.offset(upload_id)).hexdigest()
+
+    def finish(self, upload_id, destination):
+        # Moves the complete file to `destination` and returns its SHA-256
+        digest = self.sha256(upload_id)
+        os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+        shutil.move(self.path(upload_id), destination)
+        self._forget(upload_id)
+        return digest
+
+    def discard(self, upload_id):
+        try:
+            os.remove(self.path(upload_id))
+        except FileNotFoundError:
+            pass
+        self._forget(upload_id)
+
+    def part_files(self):
+        try:
+            return os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+
+    def _hash(self, upload_id, offset):
+        cached = self._hashes.get(upload_id)
+        if cached is not None and cached[0] == offset:
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(self.path(upload_id), 'rb') as part:
+            for block in iter(lambda: part.read(BLOCK_SIZE), b''):
+                digest.update(block)
+        self._hashes[upload_id] = (offset, digest)
+        return digest
+
+    def _upload_lock(self, upload_id):
+        with self._lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _forget(self, upload_id):
+        self._hashes.pop(upload_id, None)
+        with self._lock:
+            self._locks.pop(upload_id, None)
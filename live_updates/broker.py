@@ -0,0 +1,112 @@
+import queue
+import threading
+import time
+
+class Subscription:
+    # Messages published to one channel, in order, for one listener (e.g. one
+    # open event stream). A listener that stops reading is cut off once
+    # MAX_QUEUED messages are waiting, instead of holding memory forever;
+    # `overflowed` tells it to catch up from the database.
+    MAX_QUEUED = 100
+
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.overflowed = False
+        self._queue = queue.Queue(self.MAX_QUEUED)
+
+    def get(self, timeout):
+        # The next message, or None when nothing arrived within `timeout` seconds
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def put(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.overflowed = True
+            self.broker.unsubscribe(self)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+class LocalBroker:
+    # Publish/subscribe within one worker process. Enough for a single process
+    # (e.g. the development server); with several workers a message only reaches
+    # listeners connected to the worker that published it.
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def listeners(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, channel, message):
+        self._deliver(channel, message)
+
+    def _deliver(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put(message)
+
+class RedisBroker(LocalBroker):
+    # Publish/subscribe across worker processes through Redis. Messages are
+    # published to Redis; each process keeps one connection subscribed to every
+    # channel under `prefix` and hands what arrives to its local listeners, so
+    # the number of open streams does not change the number of Redis connections.
+
+    def __init__(self, url, prefix='vcms:live:'):
+        import redis
+
+        super().__init__()
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._listener = None
+
+    def subscribe(self, channel):
+        self._start_listener()
+        return super().subscribe(channel)
+
+    def publish(self, channel, message):
+        self.client.publish(self.prefix + channel, message)
+
+    def _start_listener(self):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='live-updates', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        import redis
+
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self.prefix + '*')
+                for event in pubsub.listen():
+                    channel = event['channel'].decode()[len(self.prefix):]
+                    data = event['data']
+                    self._deliver(channel, data.decode() if isinstance(data, bytes) else data)
+            except redis.ConnectionError:
+                # Messages published while disconnected are lost here; open streams
+                # read them from the database when their browser next reconnects
+                time.sleep(1)
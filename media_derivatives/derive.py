@@ -0,0 +1,118 @@
+import logging
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Resized copies of uploaded media, stored next to the original as
+# <original without extension>.<variant>.jpg:
+#   images: thumb, medium and full, each at most that many pixels wide or high
+#   videos: a poster frame, drawn by ffmpeg when it is installed
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+VIDEO_EXTENSIONS = ('.mp4',)
+IMAGE_VARIANTS = (('thumb', 320), ('medium', 1024), ('full', 2048))
+POSTER_WIDTH = 1024
+JPEG_QUALITY = 80
+
+logger = logging.getLogger(__name__)
+
+def variants(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in IMAGE_EXTENSIONS:
+        return [variant for variant, _ in IMAGE_VARIANTS]
+    if extension in VIDEO_EXTENSIONS:
+        return ['poster']
+    return []
+
+def variant_path(path, variant):
+    return os.path.splitext(path)[0] + '.' + variant + '.jpg'
+
+def derivative_paths(path):
+    return [variant_path(path, variant) for variant in variants(path)]
+
+def _save(image, target):
+    # Written under a temporary name first so a half-written file is never served
+    temporary = '%s.%d.tmp' % (target, threading.get_ident())
+    image.save(temporary, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    os.replace(temporary, target)
+
+def _render_image(path):
+    from PIL import Image, ImageOps
+
+    largest = max(width for _, width in IMAGE_VARIANTS)
+    with Image.open(path) as original:
+        # Lets the JPEG decoder scale down while decoding, far cheaper for camera photos
+        original.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(original)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        else:
+            image = image.convert('RGB')
+    # Largest first, so every variant is resized from the previous, smaller one
+    for variant, width in sorted(IMAGE_VARIANTS, key=lambda item: -item[1]):
+        image.thumbnail((width, width), Image.LANCZOS)
+        target = variant_path(path, variant)
+        if not os.path.exists(target):
+            _save(image, target)
+
+def _render_poster(path):
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        return
+    target = variant_path(path, 'poster')
+    temporary = '%s.%d.tmp.jpg' % (target, threading.get_ident())
+    # One second in skips the black first frame most recordings start with
+    for seek in ('1', '0'):
+        subprocess.run([ffmpeg, '-loglevel', 'error', '-y', '-ss', seek, '-i', path, '-frames:v', '1',
+                        '-vf', 'scale=min(%d\\,iw):-2' % POSTER_WIDTH, '-q:v', '4', temporary],
+                       check=False, timeout=120)
+        if os.path.exists(temporary):
+            os.replace(temporary, target)
+            return
+
+def render(path):
+    if not all(os.path.exists(target) for target in derivative_paths(path)):
+        if 'poster' in variants(path):
+            _render_poster(path)
+        else:
+            _render_image(path)
+
+# Decoding and re-encoding photos takes seconds, so derivatives are made on a
+# small pool of worker threads after the upload is saved. Futures of files still
+# being processed are kept in _pending so a file is never processed twice at once;
+# files that could not be decoded go in _failed so they are not retried on every view.
+_executor = None
+_executor_lock = threading.Lock()
+_pending = {}
+_failed = set()
+WORKERS = 2
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='derivatives')
+    return _executor
+
+def _done(path, future):
+    _pending.pop(path, None)
+    if future.exception() is not None:
+        _failed.add(path)
+        logger.error('derivatives of %s failed', path, exc_info=future.exception())
+
+def submit(path):
+    # Queues the derivatives of `path` unless they exist or are already queued
+    if not variants(path) or path in _failed or all(os.path.exists(target) for target in derivative_paths(path)):
+        return None
+    pool = _pool()
+    with _executor_lock:
+        future = _pending.get(path)
+        if future is None:
+            future = pool.submit(render, path)
+            _pending[path] = future
+            future.add_done_callback(lambda done: _done(path, done))
+    return future
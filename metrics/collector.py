@@ -0,0 +1,181 @@
+import bisect
+import threading
+import time
+from collections import deque
+
+# Request timings collected in-process. Every finished request adds one sample
+# per route under a single short-held lock. Histograms count into fixed buckets
+# instead of keeping samples, so a route costs the same however busy it is.
+# Numbers are per worker process and reset when it restarts.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        # (upper bound, samples at or below it) pairs, ending with ('+Inf', count)
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def quantile(self, fraction):
+        # Upper bound of the bucket holding the given fraction of samples
+        if not self.count:
+            return None
+        for bound, total in self.cumulative():
+            if total >= fraction * self.count:
+                return bound
+
+class RouteStats:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.errors = 0
+
+class RequestStats:
+    # Counters for the request in progress, kept in its WSGI environ
+    __slots__ = ('start', 'queries', 'db_seconds', 'render_seconds', '_render_started')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self._render_started = []
+
+    def start_render(self):
+        self._render_started.append(time.perf_counter())
+
+    def end_render(self):
+        if self._render_started:
+            self.render_seconds += time.perf_counter() - self._render_started.pop()
+
+class MetricsCollector:
+    def __init__(self, slow_query_seconds=0.1, slow_log_size=100):
+        self.slow_query_seconds = slow_query_seconds
+        self.routes = {}
+        self.slow_queries = deque(maxlen=slow_log_size)
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def record_query(self, stats, route, statement, seconds):
+        # Called for every statement; `stats` is None outside a request (CLI
+        # commands, background writers), whose statements only reach the slow log
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += seconds
+        if seconds >= self.slow_query_seconds:
+            with self._lock:
+                self.slow_queries.append({
+                    'at': time.time(),
+                    'route': route,
+                    'seconds': seconds,
+                    'statement': ' '.join(statement.split()),
+                })
+
+    def record_request(self, method, route, stats, status):
+        # `route` is the URL rule (e.g. /courses/<int:course_id>), not the path,
+        # so the number of series stays bounded
+        seconds = time.perf_counter() - stats.start
+        with self._lock:
+            route_stats = self.routes.get((method, route))
+            if route_stats is None:
+                route_stats = self.routes[(method, route)] = RouteStats()
+            route_stats.latency.observe(seconds)
+            route_stats.queries.observe(stats.queries)
+            route_stats.db_seconds += stats.db_seconds
+            route_stats.render_seconds += stats.render_seconds
+            if status >= 500:
+                route_stats.errors += 1
+
+    def summary(self):
+        # One row per route for the admin page, slowest total time first
+        with self._lock:
+            rows = []
+            for (method, route), stats in self.routes.items():
+                count = stats.latency.count
+                rows.append({
+                    'method': method,
+                    'route': route,
+                    'requests': count,
+                    'errors': stats.errors,
+                    'mean_ms': 1000 * stats.latency.sum / count,
+                    'p50_ms': _milliseconds(stats.latency.quantile(0.5)),
+                    'p95_ms': _milliseconds(stats.latency.quantile(0.95)),
+                    'p99_ms': _milliseconds(stats.latency.quantile(0.99)),
+                    'queries_per_request': stats.queries.sum / count,
+                    'db_ms_per_request': 1000 * stats.db_seconds / count,
+                    'render_ms_per_request': 1000 * stats.render_seconds / count,
+                    'total_seconds': stats.latency.sum,
+                })
+            slow = list(reversed(self.slow_queries))
+        rows.sort(key=lambda row: -row['total_seconds'])
+        return rows, slow
+
+    def prometheus(self, prefix='vcms_'):
+        # Text exposition format, see https://prometheus.io/docs/instrumenting/exposition_formats/
+        lines = []
+        with self._lock:
+            routes = sorted(self.routes.items())
+            for name, kind, help_text in (
+                    ('request_duration_seconds', 'histogram', 'Time from the start of a request to its response.'),
+                    ('request_queries', 'histogram', 'SQL statements issued per request.')):
+                lines.append('# HELP %s%s %s' % (prefix, name, help_text))
+                lines.append('# TYPE %s%s %s' % (prefix, name, kind))
+                for (method, route), stats in routes:
+                    histogram = stats.latency if name == 'request_duration_seconds' else stats.queries
+                    label = _labels(method, route)
+                    for bound, total in histogram.cumulative():
+                        lines.append('%s%s_bucket{%s,le="%s"} %d' % (prefix, name, label, bound, total))
+                    lines.append('%s%s_sum{%s} %s' % (prefix, name, label, _number(histogram.sum)))
+                    lines.append('%s%s_count{%s} %d' % (prefix, name, label, histogram.count))
+            for name, attribute, help_text in (
+                    ('db_seconds_total', 'db_seconds', 'Time spent waiting on SQL statements.'),
+                    ('render_seconds_total', 'render_seconds', 'Time spent rendering templates.'),
+                    ('request_errors_total', 'errors', 'Requests answered with a 5xx status.')):
+                lines.append('# HELP %s%s %s' % (prefix, name, help_text))
+                lines.append('# TYPE %s%s counter' % (prefix, name))
+                for (method, route), stats in routes:
+                    lines.append('%s%s{%s} %s' % (prefix, name, _labels(method, route), _number(getattr(stats, attribute))))
+            lines.append('# HELP %sslow_queries_logged Slow statements currently in the slow query log.' % prefix)
+            lines.append('# TYPE %sslow_queries_logged gauge' % prefix)
+            lines.append('%sslow_queries_logged %d' % (prefix, len(self.slow_queries)))
+        lines.append('# HELP %sprocess_start_time_seconds Start time of the worker process.' % prefix)
+        lines.append('# TYPE %sprocess_start_time_seconds gauge' % prefix)
+        lines.append('%sprocess_start_time_seconds %s' % (prefix, _number(self.started)))
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self.routes.clear()
+            self.slow_queries.clear()
+
+def _milliseconds(bound):
+    if bound is None or bound == '+Inf':
+        return bound
+    return 1000 * bound
+
+def _number(value):
+    return repr(float(value))
+
+def _labels(method, route):
+    return 'method="%s",route="%s"' % (method, _escape(route))
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,162 @@
+from datetime import date, datetime
+from sqlalchemy import inspect, text
+
+# Versioned schema changes for databases created by earlier releases.
+#
+# db.create_all() builds a new database straight from the models but never
+# touches tables that already exist, so every column or index added to a model
+# also gets a migration here. Migrations run in version order, each in its own
+# transaction together with its row in schema_migrations, and must be no-ops on
+# a database create_all() has just built (hence IF NOT EXISTS and the column
+# checks).
+
+MIGRATIONS = []
+
+def migration(version, name):
+    def register(function):
+        MIGRATIONS.append((version, name, function))
+        return function
+    return register
+
+def create_index(connection, name, table, *columns):
+    connection.execute(text('CREATE INDEX IF NOT EXISTS %s ON %s (%s)' % (name, table, ', '.join(columns))))
+
+def add_column(connection, table, column, definition):
+    if column not in [existing['name'] for existing in inspect(connection).get_columns(table)]:
+        connection.execute(text('ALTER TABLE %s ADD COLUMN %s %s' % (table, column, definition)))
+
+@migration(1, 'messages_created_at')
+def messages_created_at(connection):
+    add_column(connection, 'messages', 'created_at', 'DATETIME')
+
+@migration(2, 'message_and_admin_listing_indexes')
+def message_and_admin_listing_indexes(connection):
+    create_index(connection, 'message_topic_id_idx', 'messages', 'topic_id', 'id')
+    create_index(connection, 'user_roles_idx', 'users', 'roles', 'id')
+    create_index(connection, 'user_is_admin_idx', 'users', 'is_admin', 'id')
+    create_index(connection, 'course_name_idx', 'courses', 'name')
+
+@migration(3, 'foreign_key_indexes')
+def foreign_key_indexes(connection):
+    # SQLite does not index foreign keys by itself; without these every
+    # per-course or per-topic lookup, and every cascade_delete(), scans the table
+    create_index(connection, 'attendance_course_idx', 'attendance', 'course_id', 'attendance_date', 'user_id', 'status')
+    create_index(connection, 'enrollment_course_id_idx', 'course_enrollments', 'course_id')
+    create_index(connection, 'topic_course_id_idx', 'topics', 'course_id')
+    create_index(connection, 'upload_topic_id_idx', 'uploads', 'topic_id')
+    create_index(connection, 'assignment_course_id_idx', 'assignments', 'course_id', 'due_date')
+    create_index(connection, 'assignment_user_id_idx', 'assignments', 'user_id')
+    create_index(connection, 'message_created_by_idx', 'messages', 'created_by')
+
+@migration(4, 'uploads_sha256')
+def uploads_sha256(connection):
+    add_column(connection, 'uploads', 'sha256', 'VARCHAR(64)')
+
+@migration(5, 'shared_upload_files')
+def shared_upload_files(connection):
+    # Uploads with the same content now share one file (stored_files), so
+    # uploads.link_to_file stops being unique. SQLite cannot drop a constraint,
+    # so the table is rebuilt without it.
+    add_column(connection, 'uploads', 'filename', 'VARCHAR(255)')
+    unique = [constraint for constraint in inspect(connection).get_unique_constraints('uploads')
+              if constraint['column_names'] == ['link_to_file']]
+    if unique and connection.dialect.name == 'sqlite':
+        connection.execute(text(
+            'CREATE TABLE uploads_rebuilt ('
+            'id INTEGER NOT NULL PRIMARY KEY, '
+            'topic_id INTEGER NOT NULL REFERENCES topics (id) ON DELETE CASCADE ON UPDATE CASCADE, '
+            'link_to_file VARCHAR(255) NOT NULL, '
+            'sha256 VARCHAR(64), '
+            'filename VARCHAR(255))'))
+        connection.execute(text(
+            'INSERT INTO uploads_rebuilt (id, topic_id, link_to_file, sha256, filename) '
+            'SELECT id, topic_id, link_to_file, sha256, filename FROM uploads'))
+        connection.execute(text('DROP TABLE uploads'))
+        connection.execute(text('ALTER TABLE uploads_rebuilt RENAME TO uploads'))
+        create_index(connection, 'upload_topic_id_idx', 'uploads', 'topic_id')
+    elif unique:
+        connection.execute(text('ALTER TABLE uploads DROP CONSTRAINT %s' % unique[0]['name']))
+    create_index(connection, 'upload_link_idx', 'uploads', 'link_to_file')
+
+FULL_TEXT_TABLES = [
+    # (index table, content table, indexed columns)
+    ('courses_fts', 'courses', ('name', 'description')),
+    ('topics_fts', 'topics', ('name', 'description')),
+    ('messages_fts', 'messages', ('text',)),
+]
+
+@migration(6, 'full_text_search')
+def full_text_search(connection):
+    # FTS5 indexes for search_index/fts.py, one per searched table. They are
+    # external-content tables: the text stays in the original table and the
+    # triggers keep the index in step with every insert, update and delete,
+    # including bulk and cascading deletes. Other databases search with LIKE.
+    if connection.dialect.name != 'sqlite':
+        return
+    for index, table, columns in FULL_TEXT_TABLES:
+        names = ', '.join(columns)
+        new_values = ', '.join('new.' + column for column in columns)
+        old_values = ', '.join('old.' + column for column in columns)
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s, content='%s', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')" % (index, names, table)))
+        connection.execute(text(
+            'CREATE TRIGGER IF NOT EXISTS %s_insert AFTER INSERT ON %s BEGIN '
+            'INSERT INTO %s (rowid, %s) VALUES (new.id, %s); END'
+            % (index, table, index, names, new_values)))
+        connection.execute(text(
+            'CREATE TRIGGER IF NOT EXISTS %s_delete AFTER DELETE ON %s BEGIN '
+            "INSERT INTO %s (%s, rowid, %s) VALUES ('delete', old.id, %s); END"
+            % (index, table, index, index, names, old_values)))
+        connection.execute(text(
+            'CREATE TRIGGER IF NOT EXISTS %s_update AFTER UPDATE OF %s ON %s BEGIN '
+            "INSERT INTO %s (%s, rowid, %s) VALUES ('delete', old.id, %s); "
+            'INSERT INTO %s (rowid, %s) VALUES (new.id, %s); END'
+            % (index, names, table, index, index, names, old_values, index, names, new_values)))
+        # Index the rows that are already there
+        connection.execute(text("INSERT INTO %s (%s) VALUES ('rebuild')" % (index, index)))
+
+@migration(7, 'course_activity')
+def course_activity(connection):
+    # Fills the dashboard counters (course_activity, created by create_all()) for
+    # courses that existed before them; app.recount_activity() keeps them current
+    connection.execute(text(
+        'INSERT INTO course_activity (course_id, topics, messages, uploads, next_due_date) '
+        'SELECT courses.id, '
+        '(SELECT COUNT(*) FROM topics WHERE topics.course_id = courses.id), '
+        '(SELECT COUNT(*) FROM messages JOIN topics ON topics.id = messages.topic_id WHERE topics.course_id = courses.id), '
+        '(SELECT COUNT(*) FROM uploads JOIN topics ON topics.id = uploads.topic_id WHERE topics.course_id = courses.id), '
+        '(SELECT MIN(due_date) FROM assignments WHERE assignments.course_id = courses.id AND due_date >= :today) '
+        'FROM courses WHERE courses.id NOT IN (SELECT course_id FROM course_activity)'),
+        {'today': date.today().isoformat()})
+    connection.execute(text(
+        'UPDATE course_activity SET topics_added = topics, messages_added = messages, uploads_added = uploads '
+        'WHERE topics_added = 0 AND messages_added = 0 AND uploads_added = 0'))
+
+def _ensure_version_table(connection):
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        'version INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, applied_at TIMESTAMP NOT NULL)'))
+
+def applied_versions(engine):
+    with engine.begin() as connection:
+        _ensure_version_table(connection)
+        return {version for (version,) in connection.execute(text('SELECT version FROM schema_migrations'))}
+
+def pending(engine):
+    applied = applied_versions(engine)
+    return [(version, name) for version, name, _ in sorted(MIGRATIONS) if version not in applied]
+
+def upgrade(engine):
+    # Applies every pending migration and returns the (version, name) pairs applied
+    applied = applied_versions(engine)
+    done = []
+    for version, name, function in sorted(MIGRATIONS):
+        if version in applied:
+            continue
+        with engine.begin() as connection:
+            function(connection)
+            connection.execute(text('INSERT INTO schema_migrations (version, name, applied_at) VALUES (:version, :name, :applied_at)'),
+                               {'version': version, 'name': name, 'applied_at': datetime.now()})
+        done.append((version, name))
+    return done
@@ -1,27 +1,131 @@
+import base64
 import hashlib
+import hmac
+import io
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from itertools import repeat
 
-def generator(course_id,user_id):
-    import qrcode
+# Attendance tokens carry user id, course id and the last day they are valid on
+# (days since 1970-01-01), followed by a truncated HMAC-SHA256 of those fields.
+TOKEN_FORMAT = '>IIH'
+TOKEN_PAYLOAD_SIZE = struct.calcsize(TOKEN_FORMAT)
+SIGNATURE_SIZE = 12
+EPOCH = date(1970, 1, 1)
+NO_EXPIRY = 0xFFFF
+
+def _key(secret):
+    return secret.encode() if isinstance(secret, str) else secret
+
+def _signature(payload, secret):
+    return hmac.new(_key(secret), payload, hashlib.sha256).digest()[:SIGNATURE_SIZE]
+
+def make_token(user_id, course_id, secret, valid_until=None):
+    days = (valid_until - EPOCH).days if valid_until else NO_EXPIRY
+    payload = struct.pack(TOKEN_FORMAT, user_id, course_id, min(days, NO_EXPIRY))
+    token = base64.urlsafe_b64encode(payload + _signature(payload, secret))
+    return token.rstrip(b'=').decode()
 
-    user_id_data =str(user_id)
-    encoded_data=user_id_data.encode()
-    hash_obj=hashlib.sha256()
-    hash_obj.update(encoded_data)
-    user_hash_dig=hash_obj.hexdigest()
+def read_token(token, secret, today=None):
+    # Returns (user_id, course_id) for a genuine, unexpired token and None otherwise
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+    except (ValueError, TypeError):
+        return None
+    if len(raw) != TOKEN_PAYLOAD_SIZE + SIGNATURE_SIZE:
+        return None
+    payload, signature = raw[:TOKEN_PAYLOAD_SIZE], raw[TOKEN_PAYLOAD_SIZE:]
+    if not hmac.compare_digest(signature, _signature(payload, secret)):
+        return None
+    user_id, course_id, days = struct.unpack(TOKEN_FORMAT, payload)
+    today = today or date.today()
+    if days != NO_EXPIRY and (today - EPOCH).days > days:
+        return None
+    return user_id, course_id
 
-    course_id_data =str(course_id)
-    encoded_data=course_id_data.encode()
-    hash_obj=hashlib.sha256()
-    hash_obj.update(encoded_data)
-    course_hash_dig=hash_obj.hexdigest()
+def qr_location(course_id,user_id):
+    return "qr_codes/"+str(user_id)+"_"+str(course_id)+"_qrcode.png"
+
+def _qr(course_id,user_id,secret,valid_until=None):
+    import qrcode
 
     qr = qrcode.QRCode(version=4, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=3)
-    qr_data="/attendance/selfattendance/"+ user_hash_dig +"/"+course_hash_dig
+    qr_data="/attendance/selfattendance/"+make_token(user_id,course_id,secret,valid_until)
     qr.add_data(qr_data)
     qr.make(fit=True)
-    img = qr.make_image()
+    return qr
+
+def encode(course_id,user_id,secret,valid_until=None,image_format='png'):
+    # Draws the QR code in memory and returns (bytes, mimetype).
+    # PNGs are saved as 1-bit images; SVGs are drawn as a single path and need no PIL.
+    qr=_qr(course_id,user_id,secret,valid_until)
+    buffer=io.BytesIO()
+    if image_format=='svg':
+        import qrcode.image.svg
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+        return buffer.getvalue(),'image/svg+xml'
+    qr.make_image().get_image().convert('1').save(buffer,format='PNG',optimize=True)
+    return buffer.getvalue(),'image/png'
+
+def render(course_id,user_id,secret,valid_until=None):
+    img = _qr(course_id,user_id,secret,valid_until).make_image()
 
     # Save the image file
-    save_location="static/qr_codes/"+str(user_id)+"_"+str(course_id)+"_qrcode.png"
+    save_location="static/"+qr_location(course_id,user_id)
     img.save(save_location)
-    return "qr_codes/"+str(user_id)+"_"+str(course_id)+"_qrcode.png"
\ No newline at end of file
+    return qr_location(course_id,user_id)
+
+# Building and encoding the PNG through qrcode/PIL takes far longer than the
+# enrollment insert, so it runs on a small pool of worker threads instead of
+# inside the request. Futures of images still being drawn are kept in _pending
+# so a page that needs one can wait for it rather than drawing it twice.
+_executor = None
+_executor_lock = threading.Lock()
+_pending = {}
+WORKERS = 2
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='qr')
+    return _executor
+
+def generator(course_id,user_id,secret,valid_until=None):
+    # Queues the QR image for rendering and returns where it will be saved
+    location=qr_location(course_id,user_id)
+    future=_pool().submit(render,course_id,user_id,secret,valid_until)
+    _pending[location]=future
+    future.add_done_callback(lambda done: _pending.pop(location,None) if _pending.get(location) is done else None)
+    return location
+
+def ensure(course_id,user_id,secret,valid_until=None,timeout=5):
+    # Makes sure the image exists before a page links to it: waits for a queued
+    # render if there is one, otherwise draws it on the spot
+    location=qr_location(course_id,user_id)
+    future=_pending.get(location)
+    if future is not None:
+        try:
+            future.result(timeout=timeout)
+            return location
+        except Exception:
+            pass
+    if not os.path.exists("static/"+location):
+        render(course_id,user_id,secret,valid_until)
+    return location
+
+def _render_many(course_id,user_ids,secret,valid_until,processes):
+    # multiprocessing is slow to import and only bulk enrollments need it
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        for _ in pool.map(render,repeat(course_id),user_ids,repeat(secret),repeat(valid_until),chunksize=64):
+            pass
+
+def generator_many(course_id,user_ids,secret,valid_until=None,processes=None):
+    # Bulk enrollments fan the PIL work out over a process pool; the pool itself is
+    # driven from the worker thread pool so the request does not wait for it
+    return _pool().submit(_render_many,course_id,list(user_ids),secret,valid_until,processes)
@@ -0,0 +1,100 @@
+import re
+from markupsafe import Markup, escape
+from sqlalchemy import bindparam, text
+
+# Full-text search over course, topic and message text. On SQLite it reads the
+# FTS5 tables created by migration 6 (migrations/migrate.py), which triggers keep
+# current; results are ranked by bm25 with a match in a title weighing more than
+# one in a description. Other databases fall back to unranked LIKE matching.
+
+INDEX_TABLES = ('courses_fts', 'topics_fts', 'messages_fts')
+MAX_TERMS = 10
+SNIPPET_TOKENS = 16
+# LIKE results show the start of the text instead of a snippet around the match
+SNIPPET_CHARACTERS = 200
+# Marks the matched words in snippets; replaced by <mark> after escaping
+_START, _END = '\x02', '\x03'
+
+_FTS_PARTS = [
+    "SELECT 'course' AS kind, courses.id AS course_id, NULL AS topic_id, courses.name AS title, "
+    "courses.name AS course_name, snippet(courses_fts, -1, :start, :end, '…', :tokens) AS snippet, "
+    "bm25(courses_fts, 10.0, 1.0) AS rank "
+    "FROM courses_fts JOIN courses ON courses.id = courses_fts.rowid "
+    "WHERE courses_fts MATCH :query {courses}",
+
+    "SELECT 'topic', topics.course_id, topics.id, topics.name, courses.name, "
+    "snippet(topics_fts, -1, :start, :end, '…', :tokens), bm25(topics_fts, 5.0, 1.0) "
+    "FROM topics_fts JOIN topics ON topics.id = topics_fts.rowid JOIN courses ON courses.id = topics.course_id "
+    "WHERE topics_fts MATCH :query {topics}",
+
+    "SELECT 'message', topics.course_id, topics.id, topics.name, courses.name, "
+    "snippet(messages_fts, 0, :start, :end, '…', :tokens), bm25(messages_fts) "
+    "FROM messages_fts JOIN messages ON messages.id = messages_fts.rowid "
+    "JOIN topics ON topics.id = messages.topic_id JOIN courses ON courses.id = topics.course_id "
+    "WHERE messages_fts MATCH :query {topics}",
+]
+
+_LIKE_PARTS = [
+    "SELECT 'course' AS kind, courses.id AS course_id, NULL AS topic_id, courses.name AS title, "
+    "courses.name AS course_name, courses.description AS snippet, 0 AS rank "
+    "FROM courses WHERE ({match:courses.name} OR {match:courses.description}) {courses}",
+
+    "SELECT 'topic', topics.course_id, topics.id, topics.name, courses.name, topics.description, 0 "
+    "FROM topics JOIN courses ON courses.id = topics.course_id "
+    "WHERE ({match:topics.name} OR {match:topics.description}) {topics}",
+
+    "SELECT 'message', topics.course_id, topics.id, topics.name, courses.name, messages.text, 0 "
+    "FROM messages JOIN topics ON topics.id = messages.topic_id JOIN courses ON courses.id = topics.course_id "
+    "WHERE {match:messages.text} {topics}",
+]
+
+def terms(query):
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+def match_query(words):
+    # Every word must appear, each as a prefix; quoting keeps FTS5 operators
+    # (AND, NEAR, column filters...) typed by users from being interpreted
+    return ' '.join('"%s"*' % word for word in words)
+
+def _highlight(snippet):
+    if not snippet:
+        return Markup('')
+    if len(snippet) > SNIPPET_CHARACTERS:
+        snippet = snippet[:SNIPPET_CHARACTERS] + '…'
+    return Markup(str(escape(snippet)).replace(_START, '<mark>').replace(_END, '</mark>'))
+
+def search(connection, query, course_ids=None, limit=20, offset=0):
+    # Matches for `query` in courses among `course_ids` (all courses when None),
+    # best first, as rows with kind ('course', 'topic' or 'message'), course_id,
+    # topic_id, title, course_name, snippet (safe HTML) and rank
+    words = terms(query)
+    if not words or course_ids is not None and not course_ids:
+        return []
+    params = {'limit': limit, 'offset': offset}
+    fts = connection.dialect.name == 'sqlite'
+    if fts:
+        parts = _FTS_PARTS
+        params.update(query=match_query(words), start=_START, end=_END, tokens=SNIPPET_TOKENS)
+        order = 'rank, kind, course_id'
+    else:
+        like = ' AND '.join('lower({column}) LIKE :word%d' % number for number in range(len(words)))
+        parts = [re.sub(r'\{match:([\w.]+)\}', lambda found: '(%s)' % like.format(column=found.group(1)), part)
+                 for part in _LIKE_PARTS]
+        params.update({'word%d' % number: '%' + word + '%' for number, word in enumerate(words)})
+        order = 'kind, course_id, topic_id'
+    courses_filter = topics_filter = ''
+    if course_ids is not None:
+        courses_filter, topics_filter = 'AND courses.id IN :course_ids', 'AND topics.course_id IN :course_ids'
+        params['course_ids'] = list(course_ids)
+    statement = text(' UNION ALL '.join(part.format(courses=courses_filter, topics=topics_filter) for part in parts)
+                     + ' ORDER BY ' + order + ' LIMIT :limit OFFSET :offset')
+    if course_ids is not None:
+        statement = statement.bindparams(bindparam('course_ids', expanding=True))
+    rows = connection.execute(statement, params).mappings().all()
+    return [dict(row, snippet=_highlight(row['snippet'])) for row in rows]
+
+def rebuild(connection):
+    # Re-reads every indexed table, e.g. after rows were changed with the triggers missing
+    for index in INDEX_TABLES:
+        connection.execute(text("INSERT INTO %s (%s) VALUES ('rebuild')" % (index, index)))
+        connection.execute(text("INSERT INTO %s (%s) VALUES ('optimize')" % (index, index)))
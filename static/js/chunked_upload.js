@@ -0,0 +1,97 @@
+// Sends the file picked in upload.html through the chunked upload endpoints.
+// The upload's URL is remembered in localStorage per file, so picking the same
+// file again after a dropped connection or a page reload resumes from the last
+// acknowledged offset instead of starting over.
+let uploadForm = document.getElementById('upload-form');
+let uploadProgress = document.getElementById('upload-progress');
+let uploadStatus = document.getElementById('upload-status');
+const MAX_RETRIES = 5;
+
+function uploadKey(file) {
+    return 'chunked-upload:' + uploadForm.dataset.chunkedUrl + ':' + file.name + ':' + file.size + ':' + file.lastModified;
+}
+
+function showProgress(offset, size) {
+    uploadProgress.hidden = false;
+    uploadProgress.value = size ? Math.floor(100 * offset / size) : 100;
+    uploadStatus.textContent = (offset / 1048576).toFixed(1) + ' of ' + (size / 1048576).toFixed(1) + ' MB';
+}
+
+async function readState(response) {
+    let body = await response.json().catch(() => ({}));
+    // 409 carries the offset the server has, which is all a retry needs
+    if (!response.ok && response.status !== 409) {
+        throw new Error(body.error || response.statusText);
+    }
+    return body;
+}
+
+async function startOrResume(file) {
+    let key = uploadKey(file);
+    let url = localStorage.getItem(key);
+    if (url) {
+        let response = await fetch(url);
+        if (response.ok) {
+            return response.json();
+        }
+        localStorage.removeItem(key);
+    }
+    let state = await readState(await fetch(uploadForm.dataset.chunkedUrl, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size }),
+    }));
+    localStorage.setItem(key, state.url);
+    return state;
+}
+
+async function sendChunks(file, state) {
+    let offset = state.offset;
+    let retries = 0;
+    while (offset < file.size) {
+        showProgress(offset, file.size);
+        try {
+            let response = await fetch(state.url + '?offset=' + offset, {
+                method: 'PUT',
+                headers: { 'Content-Type': 'application/octet-stream' },
+                body: file.slice(offset, offset + state.chunk_bytes),
+            });
+            offset = (await readState(response)).offset;
+            retries = 0;
+        } catch (error) {
+            if (++retries > MAX_RETRIES) {
+                throw error;
+            }
+            uploadStatus.textContent = 'Connection lost, retrying...';
+            await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+            try {
+                offset = (await readState(await fetch(state.url))).offset;
+            } catch (ignored) {
+                // Still offline; the next attempt asks again
+            }
+        }
+    }
+    showProgress(offset, file.size);
+}
+
+if (uploadForm && window.fetch && window.localStorage) {
+    uploadForm.addEventListener('submit', async function (event) {
+        let file = document.getElementById('file-input').files[0];
+        if (!file) {
+            return;
+        }
+        event.preventDefault();
+        let button = document.getElementById('upload-btn');
+        button.disabled = true;
+        try {
+            let state = await startOrResume(file);
+            await sendChunks(file, state);
+            let done = await readState(await fetch(state.url + '/complete', { method: 'POST' }));
+            localStorage.removeItem(uploadKey(file));
+            window.location = done.redirect;
+        } catch (error) {
+            uploadStatus.textContent = 'Upload stopped: ' + error.message + '. Choose the same file again to resume.';
+            button.disabled = false;
+        }
+    });
+}
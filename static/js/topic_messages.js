@@ -0,0 +1,106 @@
+let messageList = document.getElementById('message-list');
+
+function messageItem(message) {
+    let item = document.createElement('li');
+    item.className = 'list-group-item d-flex justify-content-between align-items-center';
+
+    let textWrapper = document.createElement('div');
+    textWrapper.className = 'limited-text-wrapper';
+    let text = document.createElement('p');
+    text.className = 'limited-text';
+    text.textContent = message.text;
+    textWrapper.appendChild(text);
+
+    let creatorWrapper = document.createElement('div');
+    creatorWrapper.className = 'limited-text-wrapper';
+    let creator = document.createElement('i');
+    creator.className = 'creator';
+    creator.textContent = message.created_by;
+    let label = document.createElement('i');
+    label.textContent = '- Created By : ';
+    label.appendChild(creator);
+    let strong = document.createElement('strong');
+    strong.appendChild(label);
+    creatorWrapper.appendChild(strong);
+
+    let menuWrapper = document.createElement('div');
+    menuWrapper.className = 'limited-text-wrapper';
+    let deleteUrl = messageList.dataset.deleteUrl + '?message_id=' + message.id;
+    menuWrapper.innerHTML =
+        '<a class="dropdown-toggle" href="#" role="button" data-bs-toggle="dropdown" aria-expanded="false"></a>' +
+        '<ul class="dropdown-menu dropdown-menu-sm"><center><a href="' + deleteUrl + '">' +
+        '<small class="dropdown-item-sm">Delete</small></a></center></ul>';
+
+    item.appendChild(textWrapper);
+    item.appendChild(creatorWrapper);
+    item.appendChild(menuWrapper);
+    return item;
+}
+
+function loadOlderMessages() {
+    let cursor = messageList.dataset.nextCursor;
+    if (!cursor) {
+        return;
+    }
+    let button = document.getElementById('load-older-btn');
+    button.disabled = true;
+    fetch(messageList.dataset.messagesUrl + '?before=' + cursor)
+        .then(response => response.json())
+        .then(data => {
+            let loadOlder = document.getElementById('load-older');
+            let firstMessage = loadOlder.nextSibling;
+            let previousHeight = messageList.scrollHeight;
+            data.messages.forEach(message => {
+                messageList.insertBefore(messageItem(message), firstMessage);
+            });
+            // Keep the message the user was looking at in place
+            messageList.scrollTop += messageList.scrollHeight - previousHeight;
+            messageList.dataset.nextCursor = data.next_cursor || '';
+            if (data.next_cursor) {
+                button.disabled = false;
+            } else {
+                loadOlder.remove();
+            }
+        })
+        .catch(error => {
+            button.disabled = false;
+            console.error(error);
+        });
+}
+
+function showNewMessage(message) {
+    let atBottom = messageList.scrollHeight - messageList.scrollTop - messageList.clientHeight < 50;
+    messageList.appendChild(messageItem(message));
+    messageList.hidden = false;
+    let placeholder = document.getElementById('no-messages');
+    if (placeholder) {
+        placeholder.remove();
+    }
+    // Follow the conversation unless the user has scrolled up to read older messages
+    if (atBottom) {
+        messageList.scrollTop = messageList.scrollHeight;
+    }
+}
+
+// New messages arrive as server-sent events; the browser reconnects by itself
+// and the server resumes after the last message received
+function followMessages() {
+    if (!window.EventSource) {
+        return;
+    }
+    let source = new EventSource(messageList.dataset.streamUrl + '?after=' + messageList.dataset.lastId);
+    source.onmessage = event => showNewMessage(JSON.parse(event.data));
+    source.addEventListener('reload', () => {
+        source.close();
+        window.location.reload();
+    });
+}
+
+if (messageList) {
+    let button = document.getElementById('load-older-btn');
+    if (button) {
+        button.addEventListener('click', loadOlderMessages);
+    }
+    messageList.scrollTop = messageList.scrollHeight;
+    followMessages();
+}
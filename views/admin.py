@@ -0,0 +1,420 @@
+from flask import Blueprint, current_app, request, render_template, redirect, session, url_for, flash, jsonify, Response, stream_with_context
+from sqlalchemy import select, or_
+from sqlalchemy.exc import IntegrityError
+import click
+import codecs
+import csv
+import io
+import secrets
+from app import (db, identity_cache, fragment_cache, qr_cache, metrics, BULK_BATCH_SIZE, chunked, prefix_match, keyset_page,
+                 count_rows, invalidate_identity, topic_course, bump_activity, recount_activity, cascade_delete, release_files,
+                 remove_static_files, Users, Course, CourseEnrollment, CourseInstructor, Topic, Assignment, Message, Upload)
+
+# The admin panel: user and course listings, user edits and imports, deletes, and
+# the cache and performance pages. Also /metrics for Prometheus.
+
+bp=Blueprint('admin',__name__,cli_group=None)
+
+def user_filters(search=None, role=None, is_admin=None):
+    criteria=[]
+    if search:
+        criteria.append(or_(prefix_match(Users.username,search),prefix_match(Users.email,search)))
+    if role:
+        criteria.append(Users.roles==role)
+    if is_admin is not None:
+        criteria.append(Users.is_admin==is_admin)
+    return criteria
+
+def parse_flag(value):
+    # '1'/'0' query args to True/False, anything else (e.g. missing) to None
+    return {'1': True, '0': False}.get(value)
+
+def admin_user_list(title, role=None):
+    # One page of the admin user listings, filtered by the q (username/email
+    # prefix), role, admin and after (cursor) query args
+    search=request.args.get('q','').strip()
+    role=role or request.args.get('role') or None
+    criteria=user_filters(search,role,parse_flag(request.args.get('admin')))
+    users,next_cursor=keyset_page(Users.query.filter(*criteria),Users.id,request.args.get('after',type=int))
+    return render_template('admin_panel_users.html',users=users,role=title,total=count_rows(Users,*criteria),
+                           next_cursor=next_cursor,search=search,role_filter=role or '',admin_filter=request.args.get('admin',''))
+
+USER_IMPORT_FIELDS=('username','email','password','role')
+
+def import_users(rows):
+    # Creates users from dicts with username, email, password and role keys.
+    # Rows are validated and checked for existing usernames/emails BULK_BATCH_SIZE
+    # at a time with two IN queries, then the valid ones are inserted with one
+    # executemany and committed. Only one chunk of rows is held at a time, which
+    # is why this is a generator and callers must consume it to run the import.
+    # Yields (line number, username, error) for every row, error is '' on success.
+    for chunk in chunked(enumerate(rows,start=2),BULK_BATCH_SIZE):
+        # Normalized once, so the checks below see exactly the values inserted
+        chunk=[(line,(row.get('username') or '').strip(),(row.get('email') or '').strip(),row.get('password') or '',
+                (row.get('role') or '').strip().lower()) for line,row in chunk]
+        taken_usernames=set(db.session.scalars(select(Users.username).where(Users.username.in_({row[1] for row in chunk}))))
+        taken_emails=set(db.session.scalars(select(Users.email).where(Users.email.in_({row[2] for row in chunk}))))
+
+        results=[]
+        new_users=[]
+        for line,username,email,password,role in chunk:
+            error=''
+            if not username or not email or not password:
+                error='Username, email and password are required'
+            elif role not in ('student','teacher'):
+                error='Role must be student or teacher'
+            elif username in taken_usernames:
+                error='Username is already taken'
+            elif email in taken_emails:
+                error='Email already exists'
+            else:
+                taken_usernames.add(username)
+                taken_emails.add(email)
+                new_users.append({'username':username,'email':email,'password':password,'roles':role,'is_admin':False})
+            results.append((line,username,error))
+        try:
+            if new_users:
+                db.session.execute(Users.__table__.insert(),new_users)
+            db.session.commit()
+        except IntegrityError:
+            # Someone registered one of the names meanwhile; the whole batch is
+            # rolled back, the report goes on with the next one
+            db.session.rollback()
+            results=[(line,username,error or 'Username or email is already taken') for line,username,error in results]
+        yield from results
+
+def user_import_report(results):
+    # Renders import_users() results as CSV lines as they are produced
+    buffer=io.StringIO()
+    writer=csv.writer(buffer)
+    writer.writerow(('line','username','status','error'))
+    for line,username,error in results:
+        writer.writerow((line,username,'error' if error else 'created',error))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def flash_removed(removed):
+    summary=', '.join(table+': '+str(count) for table,count in removed.items() if count)
+    if summary:
+        flash('Removed rows ('+summary+')')
+
+@bp.route('/admin_panel')
+def admin_panel():
+    if 'user_id' not in session or session['user_id']==None:
+        flash("Login to continue")
+        return redirect('/login')
+    if not session['is_admin']:
+        session.clear()
+        flash('Authorization Required')
+        return redirect(url_for('auth.login'))
+    else:
+        counts={
+            'users': count_rows(Users),
+            'students': count_rows(Users,Users.roles=='student'),
+            'teachers': count_rows(Users,Users.roles=='teacher'),
+            'admins': count_rows(Users,Users.is_admin==True),
+            'courses': count_rows(Course),
+        }
+        return render_template('admin_panel.html',counts=counts)
+
+@bp.route('/admin_panel/delete')
+def delete():
+    if 'user_id' not in session or session['user_id']==None:
+        flash("Login to continue")
+        return redirect('/login')
+    if not session['is_admin']:
+        session.clear()
+        flash('Authorization Required')
+        return redirect(url_for('auth.login'))
+    else:
+        course_id=request.args.get('course_id')
+        user_id=request.args.get('user_id')
+        uploads_id=request.args.get('upload_id')
+        assignment_id=request.args.get('assignment_id')
+        topic_id=request.args.get('topic_id')
+        message_id=request.args.get('message_id')
+   
+        if course_id or user_id:
+            course_ids=[int(course_id)] if course_id else []
+            user_ids=[int(user_id)] if user_id else []
+            for course in Course.query.filter(Course.id.in_(course_ids)):
+                flash('Deleted Course'+ str((course.id,course.name)))
+            for user in Users.query.filter(Users.id.in_(user_ids)):
+                flash('Deleted User '+ str((user.id,user.username)))
+            removed=cascade_delete(course_ids=course_ids,user_ids=user_ids)
+            flash_removed(removed)
+            # Any cached user may have been enrolled in or teaching the removed courses
+            identity_cache.clear()
+            fragment_cache.bump('catalog','courses')
+        if uploads_id:
+            upload=Upload.query.get(uploads_id)
+            topic_id=upload.topic_id
+            course_id=upload.topic.course_id
+            flash('Deleted Upload id :'+ str((upload.id)))
+            db.session.delete(upload)
+            unused=release_files([upload.link_to_file])
+            bump_activity(course_id,uploads=-1)
+            db.session.commit()
+            remove_static_files(unused)
+            return redirect(url_for('topics.view_topic',topic_id=topic_id,course_id=course_id))
+        if assignment_id:
+            assignment=Assignment.query.get(assignment_id)
+            course_id=assignment.course_id
+            flash('Deleted Assignment '+ str((assignment.id,assignment.title)))
+            db.session.delete(assignment)
+            db.session.flush()
+            recount_activity([course_id],names=['next_due_date'])
+            db.session.commit()
+            fragment_cache.bump('course:%d' % course_id)
+            return redirect(url_for('main.dashboard'))
+        if topic_id:
+            topic=Topic.query.get(topic_id)
+            course_id=topic.course_id
+            flash('Deleted Topic '+ str(topic.name))
+            removed=cascade_delete(topic_ids=[topic.id])
+            flash_removed(removed)
+            fragment_cache.bump('course:%d' % course_id)
+            return redirect(url_for('courses.view_course',course_id=course_id))
+        if message_id:
+            message=Message.query.get(message_id)
+            flash('Deleted Message '+ str(message.id))
+            db.session.delete(message)
+            bump_activity(topic_course(message.topic_id),messages=-1)
+            db.session.commit()
+        return redirect(url_for('admin.admin_panel'))
+
+@bp.route('/admin_panel/courses')
+def admin_panel_courses():
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    if not session['is_admin']:
+        session.clear()
+        flash('Authorization Required')
+        return redirect(url_for('auth.login'))
+    else:
+        search=request.args.get('q','').strip()
+        criteria=[prefix_match(Course.name,search)] if search else []
+        courses,next_cursor=keyset_page(Course.query.filter(*criteria),Course.id,request.args.get('after',type=int))
+        return render_template('admin_panel_courses.html',courses=courses,total=count_rows(Course,*criteria),
+                               next_cursor=next_cursor,search=search)
+
+@bp.route('/admin_panel/users')
+def admin_panel_users():
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    if not session['is_admin']:
+        session.clear()
+        flash('Authorization Required')
+        return redirect(url_for('auth.login'))
+    else:
+        return admin_user_list('Users')
+
+@bp.route('/admin_panel/students')
+def admin_panel_students():
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    if not session['is_admin']:
+        session.clear()
+        flash('Authorization Required')
+        return redirect(url_for('auth.login'))
+    else:
+        return admin_user_list('Students',role='student')
+
+@bp.route('/admin_panel/students/courses')
+def admin_panel_students_courses():
+    user_id=request.args.get('user_id')
+    course_enrolled=CourseEnrollment.query.filter_by(user_id=user_id).all()
+    enrolled=[]
+    for course_enroll in course_enrolled:
+        enrolled.append(course_enroll.course)
+    return render_template('admin_panel_students_course.html',courses=enrolled)
+
+@bp.route('/admin_panel/students/courses_inst')
+def admin_panel_students_courses_inst():
+    user_id=request.args.get('user_id')
+    course_inst=CourseInstructor.query.filter_by(instructor_id=user_id).all()
+    inst=[]
+    for course_inst_obj in course_inst:
+        inst.append(course_inst_obj.course)
+    return render_template('admin_panel_students_course.html',courses=inst)
+
+@bp.route('/admin_panel/teachers')
+def admin_panel_teachers():
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    if not session['is_admin']:
+        session.clear()
+        flash('Authorization Required')
+        return redirect(url_for('auth.login'))
+    else:
+        return admin_user_list('Teachers',role='teacher')
+
+@bp.route('/admin_panel/users_registration')
+def admin_panel_user_registration():
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    if not session['is_admin']:
+        session.clear()
+        flash('Authorization Required')
+        return redirect(url_for('auth.login'))
+    else:
+        return render_template('admin_panel_user_registration.html')
+
+@bp.route('/admin_panel/user_edit', methods=['GET','POST'])
+def admin_panel_user_edit():
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    if not session['is_admin']:
+        session.clear()
+        flash('Authorization Required')
+        return redirect(url_for('auth.login'))
+    else:
+        if request.method=='POST':
+            user_id=request.form['user_id']
+            user=Users.query.get(user_id)
+            username=request.form['username']
+            email=request.form['email']
+            password=request.form['password']
+            role=request.form['role']
+            if username:
+                user.username=username
+            if email:
+                user.email=email
+            if password:
+                user.password=password
+            if role:
+                user.roles=role
+            db.session.commit()
+            invalidate_identity(user.id)
+            return redirect(url_for('admin.admin_panel'))
+        
+        user_id=request.args.get('user_id')
+        # print(user_id)
+        user=Users.query.get(user_id)
+        return render_template('admin_panel_user_edit.html',user=user)
+
+@bp.route('/admin_user_register', methods=['GET','POST'])
+def admin_user_register():
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    if not session['is_admin']:
+        session.clear()
+        flash('Authorization Required')
+        return redirect(url_for('auth.login'))
+    
+    if request.method == 'POST':
+        username = request.form['username']
+        email = request.form['email']
+        password = request.form['password']
+        confirm_password = request.form['confirm_password']
+        roles = request.form['role']
+        
+        errors = []
+        if not username:
+            errors.append('Username is required')
+            flash('Username is required')
+        if not email:
+            errors.append('Email is required')
+            flash('Email is required')
+        if not password:
+            errors.append('Password is required')
+            flash('Password is required')
+        if password != confirm_password:
+            errors.append('Passwords do not match')
+            flash('Passwords do not match')
+        if Users.query.filter_by(username=username).first():
+            errors.append('Username is already taken')
+            flash('Username is already taken')
+        if Users.query.filter_by(email=email).first():
+            errors.append('Email already exists')
+            flash('Email already exists')
+        
+        if errors:
+            return redirect(url_for('admin.admin_panel'))
+        else:
+            user = Users(username=username, email=email, password=password,roles=roles)
+            db.session.add(user)
+            db.session.commit()
+            flash('User Registered' + "("+str(user.id)+ " " +str(user.username)+")")
+            return redirect('admin_panel')
+
+@bp.route('/admin_panel/users_import', methods=['POST'])
+def admin_user_import():
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    if not session['is_admin']:
+        session.clear()
+        flash('Authorization Required')
+        return redirect(url_for('auth.login'))
+
+    file=request.files.get('file')
+    if not file or not file.filename:
+        flash('Choose a CSV file of users')
+        return redirect(url_for('admin.admin_panel'))
+    rows=csv.DictReader(codecs.iterdecode(file.stream,'utf-8-sig'))
+    report=user_import_report(import_users(rows))
+    return Response(stream_with_context(report),mimetype='text/csv',
+                    headers={'Content-Disposition':'attachment; filename=user_import_report.csv'})
+
+@bp.cli.command('import-users')
+@click.argument('csv_file', type=click.File('r', encoding='utf-8-sig'))
+def import_users_command(csv_file):
+    """Create users from a CSV with username,email,password,role columns."""
+    for line in user_import_report(import_users(csv.DictReader(csv_file))):
+        click.echo(line, nl=False)
+
+@bp.route('/user_to_admin', methods=['GET','POST'])
+def user_to_admin():
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    if not session['is_admin']:
+        session.clear()
+        flash('Authorization Required')
+        return redirect(url_for('auth.login'))
+    else:
+        user_id=request.args.get('user_id')
+        user=Users.query.get(user_id)
+        user.is_admin=True
+        db.session.commit()
+        invalidate_identity(user.id)
+        flash('User Promoted')
+        return redirect('admin_panel')
+
+@bp.route('/admin_panel/cache_stats')
+def cache_stats():
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    if not session['is_admin']:
+        session.clear()
+        flash('Authorization Required')
+        return redirect(url_for('auth.login'))
+
+    return jsonify({
+        'identity': {'hits': identity_cache.hits, 'misses': identity_cache.misses, 'entries': len(identity_cache)},
+        'qr': {'hits': qr_cache.hits, 'misses': qr_cache.misses, 'bytes': qr_cache.size},
+        'fragments': {'hits': fragment_cache.hits, 'misses': fragment_cache.misses},
+    })
+
+@bp.route('/admin_panel/metrics')
+def admin_panel_metrics():
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    if not session['is_admin']:
+        session.clear()
+        flash('Authorization Required')
+        return redirect(url_for('auth.login'))
+
+    routes,slow_queries=metrics.summary()
+    return render_template('admin_panel_metrics.html',routes=routes,slow_queries=slow_queries,
+                           enabled=current_app.config['METRICS_ENABLED'],slow_query_ms=current_app.config['METRICS_SLOW_QUERY_MS'])
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    # For a Prometheus scraper (Authorization: Bearer <METRICS_TOKEN>) or a logged-in admin
+    token=current_app.config['METRICS_TOKEN']
+    authorization=request.headers.get('Authorization','')
+    if not (token and secrets.compare_digest(authorization,'Bearer '+token)) and not session.get('is_admin'):
+        return Response('Authorization Required\n',status=401,mimetype='text/plain')
+    return Response(metrics.prometheus(),mimetype='text/plain; version=0.0.4')
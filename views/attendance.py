@@ -0,0 +1,170 @@
+from flask import Blueprint, current_app, request, render_template, redirect, session, url_for, flash
+from sqlalchemy import select, func
+from datetime import datetime
+import hashlib
+import threading
+from attendance_writer.group_commit import GroupCommitWriter
+from qr_generator import qr_gen
+from app import (db, parse_date, current_identity, insert_ignore, Users, Course, CourseEnrollment, CourseInstructor,
+                 Attendance)
+
+# Attendance: scanning a QR code and the per-course report.
+
+bp=Blueprint('attendance',__name__)
+
+def attendance_summary(course_id, date_from=None, date_to=None):
+    # Per-student attendance for a course, aggregated by the database.
+    # Returns (sessions held, rows) where each row has the student's id, username,
+    # days present, percentage of sessions attended and the last date attended.
+    window=[Attendance.course_id==course_id]
+    if date_from:
+        window.append(Attendance.attendance_date>=date_from)
+    if date_to:
+        window.append(Attendance.attendance_date<=date_to)
+
+    sessions_held=db.session.scalar(select(func.count(func.distinct(Attendance.attendance_date))).where(*window))
+    present=(select(Attendance.user_id,
+                    func.count().label('present'),
+                    func.max(Attendance.attendance_date).label('last_attended'))
+             .where(*window,Attendance.status=='present')
+             .group_by(Attendance.user_id)
+             .subquery())
+    rows=db.session.execute(
+        select(Users.id,Users.username,func.coalesce(present.c.present,0),present.c.last_attended)
+        .select_from(CourseEnrollment)
+        .join(Users,Users.id==CourseEnrollment.user_id)
+        .outerjoin(present,present.c.user_id==CourseEnrollment.user_id)
+        .where(CourseEnrollment.course_id==course_id)
+        .order_by(Users.id))
+    stats=[]
+    for user_id,username,days_present,last_attended in rows:
+        percentage=round(100*days_present/sessions_held,1) if sessions_held else 0
+        stats.append({'user_id':user_id,'username':username,'present':days_present,
+                      'percentage':percentage,'last_attended':last_attended})
+    return sessions_held,stats
+
+attendance_writer_lock=threading.Lock()
+
+def get_attendance_writer():
+    # One writer per app, started by the first scan that goes through it
+    services=current_app.extensions['vcms']
+    with attendance_writer_lock:
+        if services['attendance_writer'] is None:
+            services['attendance_writer']=GroupCommitWriter(db.engine,insert_ignore(Attendance))
+    return services['attendance_writer']
+
+def mark_present(user_id, course_id):
+    # Records today's attendance, returns False if it was already marked.
+    # A single INSERT ... ON CONFLICT DO NOTHING against unique_attendance replaces
+    # the old check-then-insert, so concurrent scans need no SELECT and cannot race.
+    row={'user_id':user_id,'course_id':course_id,'attendance_date':datetime.now().date(),'status':'present'}
+    if current_app.config['ATTENDANCE_GROUP_COMMIT']:
+        # Hand the session's pooled connection back before waiting on the writer,
+        # otherwise a burst of waiting requests can starve the writer of connections
+        db.session.commit()
+        return get_attendance_writer().submit(row)==1
+    result=db.session.execute(insert_ignore(Attendance).values(**row))
+    db.session.commit()
+    return result.rowcount==1
+
+@bp.route('/attendance/selfattendance/<token>', methods=['GET'])
+def scan_attendance(token):
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+
+    # The token is signed by the server, so verifying it needs no hashing of the
+    # user's enrollments; the cached identity confirms the enrollment still exists
+    scanned=qr_gen.read_token(token,current_app.config['ATTENDANCE_TOKEN_SECRET'])
+    if scanned is None or scanned[0]!=session['user_id']:
+        flash('Technical Error')
+        return redirect(url_for('main.dashboard'))
+    user_id,course_id=scanned
+    if course_id not in current_identity().enrolled:
+        flash('Technical Error')
+        return redirect(url_for('main.dashboard'))
+
+    if mark_present(user_id,course_id):
+        flash('Attendance Marked')
+    else:
+        flash("Already Marked Attendance For Today")
+    return redirect(url_for('main.dashboard'))
+
+# QR codes generated before signed tokens carried sha256(user id)/sha256(course id)
+@bp.route('/attendance/selfattendance/<user_id>/<course_id>', methods=['GET'])
+def scan_attendance_legacy(course_id,user_id):
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+
+    user_id_data = session['user_id']
+    if user_id!=hashlib.sha256(str(user_id_data).encode()).hexdigest():
+        flash('Technical Error')
+        return redirect(url_for('main.dashboard'))
+
+    for (enrolled_course_id,) in db.session.execute(select(CourseEnrollment.course_id).filter_by(user_id=user_id_data)):
+        if hashlib.sha256(str(enrolled_course_id).encode()).hexdigest() == course_id:
+            if mark_present(user_id_data,enrolled_course_id):
+                flash('Attendance Marked')
+            else:
+                flash("Already Marked Attendance For Today")
+            return redirect(url_for('main.dashboard'))
+    flash('Technical Error')
+    return redirect(url_for('main.dashboard'))
+
+@bp.route('/attendance/<int:course_id>', methods=['GET'])
+def attendance_stats(course_id):
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    
+    if  session['is_admin']==False:
+        if course_id not in current_identity().taught:
+            session.clear()
+            flash("Course Creator's Login Required")
+            return redirect(url_for('auth.login'))
+    
+    error=None
+    try:
+        date_from=parse_date(request.args.get('from'))
+        date_to=parse_date(request.args.get('to'))
+    except ValueError:
+        date_from=date_to=None
+        error='Dates must be in YYYY-MM-DD format'
+
+    sessions_held,stats=attendance_summary(course_id,date_from,date_to)
+    return render_template("attendance_stats.html",course_id=course_id,stats=stats,sessions_held=sessions_held,
+                           date_from=date_from,date_to=date_to,error=error)
+
+#------------------------------- Unused Code Start -------------------------------------------#
+@bp.route('/attendance/<int:course_id>', methods=['GET', 'POST'])
+def mark_attendance(course_id):
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    
+    course_instructor=CourseInstructor.query.get(course_id)
+    if session['user_id'] == course_instructor.user_id:
+        return redirect(url_for('auth.login',error="Only Teachers can visit this page"))
+    
+    course = Course.query.get_or_404(course_id)
+    course_enrollments = CourseEnrollment.query.filter_by(course_id=course_id).all()
+    user_ids=[]
+    for course_enrollment in course_enrollments:
+        user_ids.append(course_enrollment.user_id)
+    users=[]
+    for user_id in user_ids:
+        user=Users.query.get(user_id)
+        users.append(user)
+    attendance_date = datetime.now().date()
+
+    if request.method == 'POST':
+        for user in users:
+            status = request.form.get(str(user.id))
+            attendance = Attendance.query.filter_by(user_id=user.id, course_id=course_id, attendance_date=attendance_date).first()
+            if attendance:
+                attendance.status = status
+                db.session.commit()
+            else:
+                attendance = Attendance(user_id=user.id, course_id=course_id, attendance_date=attendance_date, status=status)
+                db.session.add(attendance)
+                db.session.commit()
+        return redirect(url_for('courses.view_course', course_id=course.id))
+    return render_template('mark_attendance.html', course=course, users=users)
+#------------------------------- Unused Code End -------------------------------------------#
@@ -0,0 +1,78 @@
+from flask import Blueprint, request, render_template, redirect, session, url_for, flash
+from app import db, Users
+
+# Registration, login and logout.
+
+bp=Blueprint('auth',__name__)
+
+@bp.route('/register', methods=['GET', 'POST'])
+def register():
+    if request.method == 'GET':
+        return render_template('register.html')
+    elif request.method == 'POST':
+        username = request.form['username']
+        email = request.form['email']
+        password = request.form['password']
+        confirm_password = request.form['confirm_password']
+        roles = request.form['role']
+        
+        errors = []
+        if not username:
+            errors.append('Username is required')
+        if not email:
+            errors.append('Email is required')
+        if not password:
+            errors.append('Password is required')
+        if password != confirm_password:
+            errors.append('Passwords do not match')
+        if Users.query.filter_by(username=username).first():
+            errors.append('Username is already taken')
+        if Users.query.filter_by(email=email).first():
+            errors.append('Email already exists')
+        
+        if errors:
+            return render_template('register.html', errors=errors)
+        else:
+
+            user = Users(username=username, email=email, password=password,roles=roles)
+            db.session.add(user)
+            db.session.commit()
+
+            session['registered'] = True
+            session['user_id'] = user.id
+            session['user_role'] = user.roles
+            session['user_email'] = user.email
+            session['username'] = user.username
+            session['is_admin'] = user.is_admin
+            flash('Sign Up Successful')
+            return redirect('/dashboard')
+
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'GET':
+        return render_template('login.html')
+    elif request.method == 'POST':
+        username = request.form['username']
+        password = request.form['password']
+        
+        user = Users.query.filter_by(username=username).first()
+        if user and user.password == password:
+            session['user_id'] = user.id
+            session['user_role'] = user.roles
+            session['user_email'] = user.email
+            session['username'] = user.username
+            session['is_admin'] = user.is_admin
+            flash("Successfully Logged In")
+            return redirect(url_for('main.dashboard'))
+        else:
+            error = 'Invalid username or password'
+            return render_template('login.html', error=error)
+
+@bp.route('/logout')
+def logout():
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    
+    session.clear()
+    flash("Logged Out Successfully")
+    return redirect(url_for('auth.login'))
@@ -0,0 +1,276 @@
+from flask import Blueprint, current_app, request, render_template, redirect, session, url_for, flash, abort, Response
+from sqlalchemy import select, or_
+from sqlalchemy.orm import selectinload
+from datetime import datetime
+from types import SimpleNamespace
+import codecs
+import csv
+import hashlib
+import json
+import re
+from qr_generator import qr_gen
+from app import (db, fragment_cache, qr_cache, BULK_BATCH_SIZE, chunked, parse_date, current_identity, invalidate_identity,
+                 primary_reads, recount_activity, mark_course_seen, Users, Course, CourseEnrollment, CourseInstructor,
+                 CourseActivity, Assignment)
+
+# The course catalog and course pages, enrollment, attendance QR codes and assignments.
+
+bp=Blueprint('courses',__name__)
+
+def generate_qr(course, user_id):
+    # Attendance QR codes stay valid until the course ends.
+    # When QR files are enabled the image is drawn in the background; this returns
+    # its location straight away. Otherwise qr_code() draws it on request.
+    if not current_app.config['QR_WRITE_FILES']:
+        return qr_gen.qr_location(course.id,user_id)
+    return qr_gen.generator(course_id=course.id,user_id=user_id,secret=current_app.config['ATTENDANCE_TOKEN_SECRET'],valid_until=course.end_date)
+
+def ensure_qr(course, user_id):
+    return qr_gen.ensure(course_id=course.id,user_id=user_id,secret=current_app.config['ATTENDANCE_TOKEN_SECRET'],valid_until=course.end_date)
+
+def render_catalog():
+    # Catalog rows for every course as JSON [[course_id, html], ...]; the enroll
+    # button differs per user so it is added around the cached rows. Cached, so
+    # read from the primary (see primary_reads).
+    with primary_reads():
+        courses=Course.query.all()
+        return json.dumps([[course.id,render_template('course_catalog_row.html',course=course)] for course in courses])
+
+def render_course_page(course_id, is_admin):
+    # The parts of view_course that are the same for every user of a course, as
+    # JSON. Admins get the topic delete menu, so they have their own copy.
+    with primary_reads():
+        course=Course.query.options(
+            selectinload(Course.topics),
+            selectinload(Course.assignments),
+        ).get(course_id)
+        if course is None:
+            return None
+        return json.dumps({
+            'id': course.id,
+            'name': course.name,
+            'description': course.description,
+            'end_date': course.end_date.isoformat() if course.end_date else None,
+            'topics_html': render_template('course_topics.html',course=course,is_admin=is_admin),
+            'assignments_html': render_template('course_assignments.html',course=course),
+        })
+
+CSV_HEADERS=('username','email')
+
+def csv_cells(file):
+    # Streams the first cell of every non-empty row of an uploaded CSV, without
+    # a header row such as "Username" or "E-mail"
+    cells=(row[0].strip() for row in csv.reader(codecs.iterdecode(file.stream,'utf-8-sig')) if row and row[0].strip())
+    first=next(cells,None)
+    if first is not None and re.sub(r'[\s_-]','',first.lower()) not in CSV_HEADERS:
+        yield first
+    yield from cells
+
+def bulk_enroll(course, identifiers):
+    # Enrolls users given by username or email, BULK_BATCH_SIZE at a time.
+    # Each batch resolves its users with one IN query, drops existing enrollments
+    # with one more, and inserts the rest with a single executemany; everything is
+    # committed as one transaction at the end.
+    # Returns a dict of counts and up to 20 identifiers that matched no user.
+    report={'enrolled':0,'already_enrolled':0,'unknown':0,'unknown_sample':[]}
+    new_user_ids=[]
+    for chunk in chunked(identifiers,BULK_BATCH_SIZE):
+        chunk=set(chunk)
+        users=db.session.execute(select(Users.id,Users.username,Users.email).where(or_(Users.username.in_(chunk),Users.email.in_(chunk)))).all()
+        unknown=chunk.difference(*[(user.username,user.email) for user in users])
+        report['unknown']+=len(unknown)
+        report['unknown_sample']+=sorted(unknown)[:20-len(report['unknown_sample'])]
+
+        user_ids={user.id for user in users}
+        enrolled=set(db.session.scalars(select(CourseEnrollment.user_id).where(CourseEnrollment.course_id==course.id,CourseEnrollment.user_id.in_(user_ids))))
+        report['already_enrolled']+=len(enrolled)
+        rows=[{'user_id':user_id,'course_id':course.id,'user_qr':qr_gen.qr_location(course.id,user_id)} for user_id in sorted(user_ids-enrolled)]
+        if rows:
+            db.session.execute(CourseEnrollment.__table__.insert(),rows)
+            report['enrolled']+=len(rows)
+            new_user_ids+=[row['user_id'] for row in rows]
+    db.session.commit()
+    invalidate_identity(*new_user_ids)
+
+    if new_user_ids and current_app.config['QR_WRITE_FILES']:
+        qr_gen.generator_many(course.id,new_user_ids,current_app.config['ATTENDANCE_TOKEN_SECRET'],course.end_date)
+    return report
+
+def is_course_instructor(course_id, user_id):
+    return db.session.get(CourseInstructor,(course_id,user_id)) is not None
+
+@bp.route('/courses')
+def courses():
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    
+    catalog = json.loads(fragment_cache.get_or_render('catalog',['catalog'],render_catalog))
+    user = current_identity()
+    return render_template('courses.html', catalog=catalog,user=user,course_enrolled=user.enrolled)
+
+@bp.route('/courses/new', methods=['GET', 'POST'])
+def new_course():
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    
+    user = current_identity()
+    if request.method == 'POST':
+        name = request.form['course_title']
+        description = request.form['course_desc']
+        start_date = datetime.strptime(request.form['start_date'], '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.form['end_date'], '%Y-%m-%d').date()
+        
+        course = Course(name=name, description=description, start_date=start_date, end_date=end_date)
+        db.session.add(course)
+        db.session.commit()
+        course_instructor=CourseInstructor(course_id=course.id,instructor_id=user.id)
+        qr_location=generate_qr(course,user.id)
+        course_enrollment=CourseEnrollment(course_id=course.id,user_id=user.id,user_qr=qr_location)
+        db.session.add(course_instructor)
+        db.session.add(course_enrollment)
+        db.session.add(CourseActivity(course_id=course.id))
+        db.session.commit()
+        invalidate_identity(user.id)
+        fragment_cache.bump('catalog')
+        return redirect(url_for('courses.courses'))
+    else:
+        return render_template('new_course.html',user=user)
+
+@bp.route('/courses/<int:course_id>')
+def view_course(course_id):
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    
+    user=current_identity()
+    is_admin=bool(session['is_admin'])
+    page=fragment_cache.get_or_render('course:%d:admin=%d' % (course_id,is_admin),['courses','course:%d' % course_id],
+                                      lambda: render_course_page(course_id,is_admin))
+    if page is None:
+        abort(404)
+    course=SimpleNamespace(**json.loads(page))
+    course.end_date=parse_date(course.end_date)
+    course_enrollment = course.id in user.enrolled
+    qr_src=None
+    if course_enrollment:
+        if mark_course_seen(user.id,course.id):
+            db.session.commit()
+        if current_app.config['QR_WRITE_FILES']:
+            qr_src=url_for('static',filename=ensure_qr(course,user.id))
+        else:
+            qr_src=url_for('courses.qr_code',course_id=course.id)
+    return render_template('view_course.html', course=course,user=user,course_enrollment=course_enrollment,qr_src=qr_src)
+
+@bp.route('/qr/<int:course_id>')
+def qr_code(course_id):
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+
+    enrollment=db.session.execute(
+        select(Course.end_date)
+        .join(CourseEnrollment,CourseEnrollment.course_id==Course.id)
+        .where(CourseEnrollment.user_id==session['user_id'],CourseEnrollment.course_id==course_id)).first()
+    if enrollment is None:
+        abort(404)
+
+    image_format='svg' if request.args.get('format')=='svg' else 'png'
+    secret=current_app.config['ATTENDANCE_TOKEN_SECRET']
+    token=qr_gen.make_token(session['user_id'],course_id,secret,enrollment.end_date)
+    # The image is a pure function of the token, so the token makes a strong validator
+    etag=hashlib.sha256((token+image_format).encode()).hexdigest()[:32]
+    if request.if_none_match.contains(etag):
+        response=Response(status=304)
+    else:
+        data=qr_cache.get((token,image_format))
+        if data is None:
+            data,_=qr_gen.encode(course_id,session['user_id'],secret,enrollment.end_date,image_format)
+            qr_cache.set((token,image_format),data)
+        response=Response(data,mimetype='image/svg+xml' if image_format=='svg' else 'image/png')
+    response.set_etag(etag)
+    response.cache_control.private=True
+    response.cache_control.no_cache=True
+    return response
+
+@bp.route('/courses/<int:course_id>/assignment/<int:assignment_id>')
+def view_assignment(course_id,assignment_id):
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    
+    course = Course.query.get_or_404(course_id)
+    assignments = Assignment.query.get(assignment_id)
+    return render_template('assignments.html', course=course, assignments=assignments)
+
+@bp.route('/courses/<int:course_id>/assignments/new' , methods=['GET', 'POST'])
+def new_assignments(course_id):
+    if 'user_id' not in session or session['user_id']==None :
+        return redirect('/login')
+    if session['user_role']!='teacher':
+        return redirect(url_for('courses.view_course',course_id=course_id))
+    
+    if request.method == 'POST':
+        name = request.form['assignment_title']
+        desc = request.form['assignment_desc']
+        due = parse_date(request.form['end_date'])
+        user_id = session['user_id']
+        assignment = Assignment(title=name,description = desc,due_date = due,course_id=course_id,user_id=user_id)
+        db.session.add(assignment)
+        db.session.flush()
+        recount_activity([course_id],names=['next_due_date'])
+        db.session.commit()
+        fragment_cache.bump('course:%d' % course_id)
+        return redirect(url_for('courses.view_course', course_id=course_id))
+    else:
+        return render_template('new_assignments.html', course_id=course_id)
+
+@bp.route('/courses/<int:course_id>/enroll')
+def enroll_in_course(course_id):
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    
+    course = Course.query.get_or_404(course_id)
+    user = current_identity()
+
+    duplicate_check = db.session.get(CourseEnrollment,(user.id,course.id))
+    if duplicate_check:
+        flash('Already enrolled')
+        return redirect(url_for('main.dashboard'))
+    else:
+        qr_location=generate_qr(course,user.id)
+        course_enrol=CourseEnrollment(course_id=course.id,user_id=user.id,user_qr=qr_location)
+        db.session.add(course_enrol)
+        db.session.commit()
+        invalidate_identity(user.id)
+        return redirect(url_for('main.dashboard'))
+
+@bp.route('/courses/<int:course_id>/enroll/bulk', methods=['GET','POST'])
+def bulk_enroll_in_course(course_id):
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+
+    course = Course.query.get_or_404(course_id)
+    if not session['is_admin'] and not is_course_instructor(course.id,session['user_id']):
+        flash("Course Creator's Login Required")
+        return redirect(url_for('courses.view_course',course_id=course.id))
+
+    if request.method=='POST':
+        file=request.files.get('file')
+        if not file or not file.filename:
+            flash('Choose a CSV file of usernames or emails')
+            return redirect(url_for('courses.bulk_enroll_in_course',course_id=course.id))
+        report=bulk_enroll(course,csv_cells(file))
+        flash('Enrolled '+str(report['enrolled'])+' students, '+str(report['already_enrolled'])+' already enrolled')
+        if report['unknown']:
+            flash(str(report['unknown'])+' unknown users: '+', '.join(report['unknown_sample']))
+        return redirect(url_for('courses.view_course',course_id=course.id))
+    return render_template('bulk_enroll.html',course=course)
+
+@bp.route('/courses/<int:course_id>/unenroll')
+def unenroll(course_id):
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    
+    course_unenroll=CourseEnrollment.query.filter_by(course_id=course_id, user_id=session['user_id']).first()
+    db.session.delete(course_unenroll)
+    db.session.commit()
+    invalidate_identity(session['user_id'])
+    flash("Unenrolled Successfully")
+    return redirect(url_for('main.dashboard'))
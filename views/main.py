@@ -0,0 +1,62 @@
+from flask import Blueprint, request, render_template, redirect, session
+from datetime import date
+import click
+from migrations import migrate
+from search_index import fts
+from app import db, current_identity, dashboard_courses, Assignment
+
+# The home page, the dashboard and search.
+
+bp=Blueprint('main',__name__,cli_group=None)
+
+@bp.route('/',methods=['GET','POST'])
+def homepage():
+    return render_template('homepage.html')
+
+DASHBOARD_ASSIGNMENTS=50
+
+@bp.route('/dashboard')
+def dashboard():
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    
+    user = current_identity()
+    # One query for the enrolled courses with their badges (see dashboard_courses())
+    # and one for the assignments still to come
+    courses = dashboard_courses(user)
+    assignments = (Assignment.query
+                   .filter(Assignment.course_id.in_(user.enrolled),Assignment.due_date>=date.today())
+                   .order_by(Assignment.due_date)
+                   .limit(DASHBOARD_ASSIGNMENTS)
+                   .all())
+    
+    return render_template('dashboard.html', user=user,courses=courses,assignments=assignments)
+
+SEARCH_PAGE_SIZE=20
+
+@bp.route('/search')
+def search():
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+
+    # Ranked matches in the courses the user takes or teaches (every course for admins),
+    # see search_index/fts.py
+    query=request.args.get('q','').strip()
+    page=max(request.args.get('page',1,type=int),1)
+    user=current_identity()
+    course_ids=None if user.is_admin else user.enrolled|user.taught
+    results=fts.search(db.session.connection(),query,course_ids,limit=SEARCH_PAGE_SIZE+1,offset=(page-1)*SEARCH_PAGE_SIZE)
+    return render_template('search.html',query=query,results=results[:SEARCH_PAGE_SIZE],page=page,
+                           has_next=len(results)>SEARCH_PAGE_SIZE)
+
+@bp.cli.command('rebuild-search')
+def rebuild_search_command():
+    """Rebuild the full-text search index from the courses, topics and messages tables."""
+    db.create_all(bind_key=None)
+    migrate.upgrade(db.engine)
+    if db.engine.dialect.name!='sqlite':
+        click.echo('nothing to rebuild: full-text indexes are only used on SQLite')
+        return
+    with db.engine.begin() as connection:
+        fts.rebuild(connection)
+    click.echo('rebuilt %s' % ', '.join(fts.INDEX_TABLES))
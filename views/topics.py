@@ -0,0 +1,137 @@
+from flask import Blueprint, current_app, request, render_template, redirect, session, url_for, jsonify, Response
+from sqlalchemy.orm import selectinload, joinedload
+import json
+import time
+from app import db, fragment_cache, message_broker, topic_course, bump_activity, Topic, Message
+
+# Topics and their messages, including the live message stream.
+
+bp=Blueprint('topics',__name__)
+
+MESSAGES_PER_PAGE=50
+
+def message_page(topic_id, before=None, limit=MESSAGES_PER_PAGE):
+    # Keyset pagination over a topic's messages, newest page first.
+    # `before` is the cursor returned by the previous page (a message id); the
+    # returned messages are oldest-first so they can be rendered as they are.
+    query=Message.query.options(joinedload(Message.creator)).filter(Message.topic_id==topic_id)
+    if before:
+        query=query.filter(Message.id<before)
+    messages=query.order_by(Message.id.desc()).limit(limit+1).all()
+    next_cursor=None
+    if len(messages)>limit:
+        messages=messages[:limit]
+        next_cursor=messages[-1].id
+    messages.reverse()
+    return messages,next_cursor
+
+@bp.route('/courses/<int:course_id>/topics/new', methods=['GET', 'POST'])
+def new_topic(course_id):
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    
+    if request.method == 'POST':
+        name = request.form['title']
+        description = request.form['description']
+        topic = Topic(name=name, course_id=course_id,description=description)
+        db.session.add(topic)
+        bump_activity(course_id,topics=1)
+        db.session.commit()
+        fragment_cache.bump('course:%d' % course_id)
+        return redirect(url_for('courses.view_course', course_id=course_id))
+    else:
+        return render_template('new_topic.html', course_id=course_id)
+
+@bp.route('/courses/<int:course_id>/topics/<int:topic_id>')
+def view_topic(course_id, topic_id):
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    
+    # Only the newest page of messages is rendered, older ones are fetched on demand
+    # from topic_messages(), so the first render costs the same however long the topic is
+    topic = Topic.query.options(selectinload(Topic.uploads)).get(topic_id)
+    messages,next_cursor = message_page(topic_id)
+    return render_template('view_topic.html', course_id=course_id, topic=topic, messages=messages, next_cursor=next_cursor)
+
+@bp.route('/courses/<int:course_id>/topics/<int:topic_id>/messages')
+def topic_messages(course_id, topic_id):
+    if 'user_id' not in session or session['user_id']==None:
+        return jsonify({'error': 'Login to continue'}), 401
+
+    before = request.args.get('before', type=int)
+    limit = min(request.args.get('limit', MESSAGES_PER_PAGE, type=int), MESSAGES_PER_PAGE)
+    messages,next_cursor = message_page(topic_id, before=before, limit=max(limit, 1))
+    return jsonify({'messages': [message.to_dict() for message in messages], 'next_cursor': next_cursor})
+
+def message_event(message):
+    return 'id: %d\ndata: %s\n\n' % (message['id'], json.dumps(message))
+
+@bp.route('/courses/<int:course_id>/topics/<int:topic_id>/messages/stream')
+def topic_message_stream(course_id, topic_id):
+    if 'user_id' not in session or session['user_id']==None:
+        return jsonify({'error': 'Login to continue'}), 401
+
+    # Server-sent events with every message posted after `after` (the newest one the
+    # page has). A reconnecting EventSource sends the id of the last event it got as
+    # Last-Event-ID, which takes precedence.
+    after = request.headers.get('Last-Event-ID', type=int)
+    if after is None:
+        after = request.args.get('after', type=int)
+    # Subscribed before reading the database, so a message posted in between is not missed
+    subscription = message_broker.subscribe('topic:%d' % topic_id)
+    missed = []
+    if after is not None:
+        missed = [message.to_dict() for message in
+                  Message.query.options(joinedload(Message.creator))
+                  .filter(Message.topic_id==topic_id, Message.id>after)
+                  .order_by(Message.id).limit(MESSAGES_PER_PAGE+1)]
+    stream_seconds = current_app.config['LIVE_STREAM_SECONDS']
+    heartbeat_seconds = current_app.config['LIVE_HEARTBEAT_SECONDS']
+
+    def stream():
+        # Runs after the request has ended and never touches the database: waiting
+        # clients cost a thread each and nothing else
+        last_id = after or 0
+        try:
+            yield 'retry: 2000\n\n'
+            if len(missed)>MESSAGES_PER_PAGE:
+                # Too far behind to replay, the page is reloaded instead
+                yield 'event: reload\ndata: \n\n'
+                return
+            for message in missed:
+                last_id = message['id']
+                yield message_event(message)
+            # Streams end after a while so a worker is not held forever; the browser
+            # reconnects by itself and carries on from its last event
+            deadline = time.monotonic()+stream_seconds
+            while time.monotonic()<deadline and not subscription.overflowed:
+                data = subscription.get(timeout=min(heartbeat_seconds, max(deadline-time.monotonic(), 0)))
+                if data is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                message = json.loads(data)
+                if message['id']>last_id:
+                    last_id = message['id']
+                    yield message_event(message)
+        finally:
+            subscription.close()
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@bp.route('/courses/<int:course_id>/topics/<int:topic_id>/messages/new', methods=['GET', 'POST'])
+def new_message(course_id, topic_id):
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    
+    if request.method == 'POST':
+        text = request.form['msg_text']
+        created_by = session['user_id']
+        message = Message(text=text, topic_id=topic_id,created_by=created_by)
+        db.session.add(message)
+        bump_activity(topic_course(topic_id),messages=1)
+        db.session.commit()
+        message_broker.publish('topic:%d' % topic_id, json.dumps(message.to_dict()))
+        return redirect(url_for('topics.view_topic', course_id=course_id, topic_id=topic_id))
+    else:
+        return render_template('new_message.html', course_id=course_id, topic_id=topic_id)
@@ -0,0 +1,273 @@
+from flask import Blueprint, current_app, request, render_template, redirect, session, url_for, flash, jsonify, abort, Response, send_file
+from sqlalchemy import select, update, delete as sql_delete
+from werkzeug.utils import secure_filename
+import click
+import hashlib
+import hmac
+import mimetypes
+import os
+import posixpath
+import re
+import secrets
+import shutil
+import time
+from chunked_upload.store import OffsetMismatch, file_sha256
+from media_derivatives import derive
+from app import (db, upload_store, BULK_BATCH_SIZE, chunked, current_identity, stored_file_link, add_file_reference,
+                 save_upload, remove_static_files, with_derivatives, StoredFile, Topic, Upload, UploadSession)
+
+# Topic materials: plain and chunked uploads, downloads, and the upload maintenance commands.
+
+bp=Blueprint('uploads',__name__,cli_group=None)
+
+def completed_upload(upload, course_id):
+    return {
+        'id': upload.id,
+        'url': url_for('uploads.download_upload',upload_id=upload.id),
+        'redirect': url_for('topics.view_topic',course_id=course_id,topic_id=upload.topic_id),
+    }
+
+def upload_etag(digest, variant=''):
+    # Derived from the content's SHA-256 without giving it away: knowing a file's
+    # hash must not tell anyone which upload holds it. True lets send_file make one.
+    if not digest:
+        return True
+    return hmac.new(current_app.config['SECRET_KEY'].encode(),(digest+variant).encode(),hashlib.sha256).hexdigest()[:32]
+
+def chunked_upload_state(upload_session, course_id, offset):
+    return {
+        'id': upload_session.id,
+        'offset': offset,
+        'size': upload_session.size,
+        'chunk_bytes': current_app.config['UPLOAD_CHUNK_BYTES'],
+        'url': url_for('uploads.chunked_upload',course_id=course_id,topic_id=upload_session.topic_id,upload_id=upload_session.id),
+    }
+
+@bp.route('/courses/<int:course_id>/topics/<int:topic_id>/upload', methods=["GET","POST"])
+def upload(course_id,topic_id):
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+    
+    # Browsers with JavaScript use the chunked endpoints below; this plain form
+    # post is the fallback and goes through the same store
+    if request.method=='POST':
+        file = request.files['file']
+        upload_id=secrets.token_hex(16)
+        upload_store.begin(upload_id)
+        try:
+            upload_store.append(upload_id,0,file.stream,current_app.config['UPLOAD_MAX_BYTES'])
+        except ValueError:
+            upload_store.discard(upload_id)
+            flash('File is too large')
+            return redirect(url_for('uploads.upload',course_id=course_id,topic_id=topic_id))
+        save_upload(topic_id,secure_filename(file.filename),upload_id)
+        db.session.commit()
+        return redirect(url_for('topics.view_topic',course_id=course_id,topic_id=topic_id))
+
+    if request.method=='GET':
+        topic = Topic.query.get(topic_id)
+        return render_template("upload.html",course_id=course_id,topic_id=topic_id,topic=topic)
+
+# Chunked upload protocol:
+#   POST   .../upload/chunked  {"filename", "size"}  starts an upload, returns its state
+#   GET    .../upload/chunked/<id>                  state, including the acknowledged offset
+#   PUT    .../upload/chunked/<id>?offset=N         raw bytes of the next chunk
+#   POST   .../upload/chunked/<id>/complete         creates the Upload once all bytes are in
+#   DELETE .../upload/chunked/<id>                  abandons the upload
+# A PUT whose offset is not the acknowledged one gets 409 with the right offset.
+
+@bp.route('/courses/<int:course_id>/topics/<int:topic_id>/upload/chunked', methods=['POST'])
+def start_chunked_upload(course_id, topic_id):
+    if 'user_id' not in session or session['user_id']==None:
+        return jsonify({'error': 'Login to continue'}), 401
+
+    Topic.query.filter_by(id=topic_id,course_id=course_id).first_or_404()
+    data=request.get_json(silent=True) or {}
+    filename=secure_filename(str(data.get('filename') or ''))
+    size=data.get('size')
+    if not filename or not isinstance(size,int) or isinstance(size,bool) or size<0:
+        return jsonify({'error': 'filename and size are required'}), 400
+    if size>current_app.config['UPLOAD_MAX_BYTES']:
+        return jsonify({'error': 'File is too large', 'max_bytes': current_app.config['UPLOAD_MAX_BYTES']}), 413
+    upload_session=UploadSession(id=secrets.token_hex(16),topic_id=topic_id,user_id=session['user_id'],filename=filename,size=size)
+    db.session.add(upload_session)
+    db.session.commit()
+    upload_store.begin(upload_session.id)
+    return jsonify(chunked_upload_state(upload_session,course_id,0)), 201
+
+@bp.route('/courses/<int:course_id>/topics/<int:topic_id>/upload/chunked/<upload_id>', methods=['GET','PUT','DELETE'])
+def chunked_upload(course_id, topic_id, upload_id):
+    if 'user_id' not in session or session['user_id']==None:
+        return jsonify({'error': 'Login to continue'}), 401
+
+    upload_session=UploadSession.query.filter_by(id=upload_id,topic_id=topic_id,user_id=session['user_id']).first_or_404()
+    if request.method=='DELETE':
+        db.session.delete(upload_session)
+        db.session.commit()
+        upload_store.discard(upload_id)
+        return '', 204
+
+    offset=upload_store.offset(upload_id)
+    if offset is None:
+        # The partial file was purged, the upload has to start over
+        db.session.delete(upload_session)
+        db.session.commit()
+        return jsonify({'error': 'Upload expired'}), 410
+    if request.method=='PUT':
+        if request.content_length is None:
+            return jsonify({'error': 'Content-Length is required'}), 411
+        if request.content_length>current_app.config['UPLOAD_CHUNK_BYTES']:
+            return jsonify({'error': 'Chunk is too large', 'chunk_bytes': current_app.config['UPLOAD_CHUNK_BYTES']}), 413
+        state=chunked_upload_state(upload_session,course_id,offset)
+        # Do not hold the database connection while the chunk streams in
+        db.session.commit()
+        try:
+            state['offset']=upload_store.append(upload_id,request.args.get('offset',type=int),request.stream,state['size'])
+        except OffsetMismatch as mismatch:
+            state['offset']=mismatch.offset
+            return jsonify(dict(state,error='Offset does not match the data received so far')), 409
+        except ValueError:
+            return jsonify(dict(state,error='Chunk goes past the declared size')), 413
+        return jsonify(state)
+    return jsonify(chunked_upload_state(upload_session,course_id,offset))
+
+@bp.route('/courses/<int:course_id>/topics/<int:topic_id>/upload/chunked/<upload_id>/complete', methods=['POST'])
+def complete_chunked_upload(course_id, topic_id, upload_id):
+    if 'user_id' not in session or session['user_id']==None:
+        return jsonify({'error': 'Login to continue'}), 401
+
+    upload_session=UploadSession.query.filter_by(id=upload_id,topic_id=topic_id,user_id=session['user_id']).first_or_404()
+    offset=upload_store.offset(upload_id)
+    if offset!=upload_session.size:
+        return jsonify(dict(chunked_upload_state(upload_session,course_id,offset),error='Upload is incomplete')), 409
+    upload=save_upload(topic_id,upload_session.filename,upload_id)
+    db.session.delete(upload_session)
+    db.session.commit()
+    return jsonify(completed_upload(upload,course_id)), 201
+
+@bp.cli.command('purge-uploads')
+@click.option('--hours', default=48, show_default=True, help='Remove chunked uploads idle for longer than this.')
+def purge_uploads_command(hours):
+    """Remove chunked uploads that were started but never completed."""
+    cutoff=time.time()-hours*3600
+    sessions=set(db.session.scalars(select(UploadSession.id)))
+    parts=set(upload_store.part_files())
+
+    def idle(upload_id):
+        # Plain form uploads stream through the store without a session row, so a
+        # part file is only removed once idle, whether or not it has a session
+        try:
+            return os.path.getmtime(upload_store.path(upload_id))<cutoff
+        except FileNotFoundError:
+            return False  # finished meanwhile
+    stale=(sessions-parts)|{upload_id for upload_id in parts if idle(upload_id)}
+    db.session.execute(sql_delete(UploadSession).where(UploadSession.id.in_(stale)))
+    db.session.commit()
+    for upload_id in stale:
+        upload_store.discard(upload_id)
+    click.echo('removed %d abandoned uploads' % len(stale))
+
+LEGACY_UPLOAD_LINK=re.compile(r'uploads/_\d+_\d+_(?:[0-9a-f]{8}_)?(.+)$')
+
+@bp.cli.command('dedupe-uploads')
+def dedupe_uploads_command():
+    """Move uploads stored one copy per topic into shared, content-addressed files."""
+    legacy=db.session.execute(select(Upload.id,Upload.link_to_file)
+                              .where(Upload.link_to_file.not_in(select(StoredFile.path))).order_by(Upload.id)).all()
+    stored=shared=missing=0
+    freed=0
+    for batch in chunked(legacy,BULK_BATCH_SIZE):
+        replaced=[]
+        for upload_id,link in batch:
+            source='static/'+link
+            if not os.path.exists(source):
+                click.echo('missing file for upload %d: %s' % (upload_id,source))
+                missing+=1
+                continue
+            digest,size=file_sha256(source)
+            match=LEGACY_UPLOAD_LINK.match(link)
+            filename=match.group(1) if match else os.path.basename(link)
+            target=stored_file_link(digest,filename)
+            if os.path.exists('static/'+target):
+                shared+=1
+                freed+=size
+            else:
+                # Link (or copy) rather than move, so the old path stays valid until the rows are committed
+                os.makedirs(os.path.dirname('static/'+target),exist_ok=True)
+                try:
+                    os.link(source,'static/'+target)
+                except OSError:
+                    shutil.copyfile(source,'static/'+target)
+                stored+=1
+            add_file_reference(target,digest,size)
+            db.session.execute(update(Upload).where(Upload.id==upload_id).values(link_to_file=target,sha256=digest,filename=filename))
+            replaced.append(link)
+        db.session.commit()
+        remove_static_files(with_derivatives(replaced))
+    click.echo('%d files stored, %d duplicates shared (%.1f MB freed), %d missing' % (stored,shared,freed/1048576,missing))
+
+@bp.before_app_request
+def protect_uploads():
+    # Uploaded files are only served through download_upload(), which checks enrollment
+    if request.endpoint=='static' and posixpath.normpath((request.view_args or {}).get('filename','')).startswith('uploads/'):
+        abort(404)
+
+@bp.route('/uploads/<int:upload_id>')
+def download_upload(upload_id):
+    if 'user_id' not in session or session['user_id']==None:
+        return redirect('/login')
+
+    upload=db.session.execute(
+        select(Upload.link_to_file,Upload.sha256,Upload.filename,Topic.course_id)
+        .join(Topic,Topic.id==Upload.topic_id)
+        .where(Upload.id==upload_id)).first()
+    if upload is None:
+        abort(404)
+    user=current_identity()
+    if not (user.is_admin or upload.course_id in user.enrolled or upload.course_id in user.taught):
+        abort(403)
+    path=os.path.abspath('static/'+upload.link_to_file)
+    if not os.path.isfile(path):
+        abort(404)
+
+    link=upload.link_to_file
+    filename=upload.filename or posixpath.basename(link)
+    etag=upload_etag(upload.sha256)
+    final=True
+    variant=request.args.get('variant')
+    if variant:
+        # ?variant=thumb|medium|full|poster picks a resized copy (media_derivatives/derive.py)
+        if variant not in derive.variants(link):
+            abort(404)
+        if os.path.isfile('static/'+derive.variant_path(link,variant)):
+            link=derive.variant_path(link,variant)
+            path=os.path.abspath('static/'+link)
+            filename=os.path.splitext(filename)[0]+'.'+variant+'.jpg'
+            etag=upload_etag(upload.sha256,variant)
+        else:
+            # Not made yet (or the upload predates derivatives): queue it and make
+            # do with the original meanwhile, without letting browsers keep that
+            derive.submit('static/'+upload.link_to_file)
+            if variant=='poster':
+                abort(404)
+            final=False
+
+    as_attachment=request.args.get('download')=='1'
+    if current_app.config['UPLOAD_ACCEL_REDIRECT']:
+        # nginx serves the file, including ranges and conditional requests
+        response=Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect']=current_app.config['UPLOAD_ACCEL_REDIRECT'].rstrip('/')+'/'+link
+        response.headers['Content-Disposition']=('attachment' if as_attachment else 'inline')+'; filename="'+secure_filename(filename)+'"'
+    else:
+        # send_file answers Range, If-Range and If-None-Match itself; the file body
+        # goes through the server's wsgi.file_wrapper (sendfile where available).
+        # Content-addressed files get a strong ETag from their SHA-256, see upload_etag().
+        response=send_file(path,download_name=filename,as_attachment=as_attachment,conditional=True,
+                           etag=etag,max_age=None)
+    # An upload id always refers to the same bytes, so browsers may keep it; private
+    # because access depends on the user's enrollment
+    response.cache_control.private=True
+    if final:
+        response.cache_control.no_cache=None
+        response.cache_control.max_age=current_app.config['UPLOAD_MAX_AGE']
+    return response
@@ -1,7 +1,10 @@
-from app import app
+from app import create_app, create_admin
+
+app = create_app()
 
 #-------------------------------------------------------------- App Run --------------------------------------------------#
 
 if __name__=="__main__":
-    create_admin()  # Creates admin When Database Is Created
+    with app.app_context():
+        create_admin()  # Creates admin When Database Is Created
     app.run(debug=False)    # Remove Debugging options When Deploying the Project